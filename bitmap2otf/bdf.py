@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import binascii
+import gzip
+import io
+import logging
+import struct
+
+log = logging.getLogger(__name__)
+
+
+class FontFileError(Exception):
+    pass
+
+
+class FontFileGlyph(object):
+    """Glyph read from a bitmap font file.
+
+    data is the packed bitmap: rows from top to bottom, each row MSB-first
+    and padded to a byte boundary.
+    """
+
+    def __init__(self, name, encoding, bbx, dwidth, data):
+        self.name = name
+        self.encoding = encoding
+        self.width, self.height, self.xoff, self.yoff = bbx
+        self.dwidth = dwidth
+        self.data = data
+
+
+def _openBinary(path):
+    if isinstance(path, (bytes, bytearray)):
+        f = io.BytesIO(path)
+        if path[:2] == b"\x1f\x8b":
+            return gzip.GzipFile(fileobj=f, mode="rb")
+        return f
+    f = open(path, "rb")
+    if f.read(2) == b"\x1f\x8b":
+        f.close()
+        return gzip.open(path, "rb")
+    f.seek(0)
+    return f
+
+
+def openFontFile(path):
+    """Opens a BDF or PCF file (optionally gzipped), given as a path or as
+    the bytes of the file."""
+    f = _openBinary(path)
+    magic = f.read(4)
+    f.seek(0)
+    if magic == b"\x01fcp":
+        return PCFFile(f)
+    return BDFFile(f)
+
+
+class BDFFile(object):
+    """BDF file reader.
+
+    The header is read on construction; the glyphs are read one by one while
+    iterating, so the whole file is never held in memory.  It can be
+    iterated only once.
+    """
+
+    def __init__(self, f):
+        self._file = io.TextIOWrapper(f, encoding="latin-1")
+        self.properties = {}
+        self.bbx = (0, 0, 0, 0)
+        self.dwidth = None
+        self.numGlyphs = None
+
+        line = self._readline()
+        if line is None or not line.startswith("STARTFONT"):
+            raise FontFileError("not a BDF file")
+        while True:
+            line = self._readline()
+            if line is None:
+                raise FontFileError("unexpected end of BDF file")
+            keyword, _, args = line.partition(" ")
+            if keyword == "FONTBOUNDINGBOX":
+                self.bbx = tuple(int(v) for v in args.split())
+            elif keyword == "DWIDTH":
+                self.dwidth = int(args.split()[0])
+            elif keyword == "STARTPROPERTIES":
+                self._readProperties()
+            elif keyword == "CHARS":
+                self.numGlyphs = int(args)
+                break
+
+    def _readline(self):
+        line = self._file.readline()
+        if not line:
+            return None
+        return line.strip()
+
+    def _readProperties(self):
+        while True:
+            line = self._readline()
+            if line is None:
+                raise FontFileError("unexpected end of BDF file")
+            if line == "ENDPROPERTIES":
+                return
+            key, _, value = line.partition(" ")
+            value = value.strip()
+            if value.startswith("\""):
+                value = value[1:-1].replace("\"\"", "\"")
+            else:
+                try:
+                    value = int(value)
+                except ValueError:
+                    pass
+            self.properties[key] = value
+
+    def __iter__(self):
+        try:
+            while True:
+                line = self._readline()
+                if line is None or line == "ENDFONT":
+                    return
+                if line.startswith("STARTCHAR"):
+                    yield self._readGlyph(line[len("STARTCHAR"):].strip())
+        finally:
+            self._file.close()
+
+    def _readGlyph(self, name):
+        encoding = -1
+        bbx = self.bbx
+        dwidth = self.dwidth
+        while True:
+            line = self._readline()
+            if line is None:
+                raise FontFileError("unexpected end of BDF file")
+            keyword, _, args = line.partition(" ")
+            if keyword == "ENCODING":
+                encoding = int(args.split()[0])
+            elif keyword == "DWIDTH":
+                dwidth = int(args.split()[0])
+            elif keyword == "BBX":
+                bbx = tuple(int(v) for v in args.split())
+            elif keyword == "BITMAP":
+                break
+            elif keyword == "ENDCHAR":
+                raise FontFileError(
+                    "BITMAP not found in glyph '{}'".format(name))
+
+        rowsize = (bbx[0] + 7) // 8
+        data = bytearray()
+        while True:
+            line = self._readline()
+            if line is None:
+                raise FontFileError("unexpected end of BDF file")
+            if line == "ENDCHAR":
+                break
+            row = line[:rowsize * 2]
+            row += "0" * (rowsize * 2 - len(row))
+            try:
+                data += binascii.unhexlify(row)
+            except (binascii.Error, TypeError, ValueError):
+                raise FontFileError(
+                    "invalid bitmap data in glyph '{}'".format(name))
+        if len(data) != rowsize * bbx[1]:
+            raise FontFileError(
+                "glyph '{}' has {} rows instead of {}".format(name, len(data) // max(rowsize, 1), bbx[1]))
+        if dwidth is None:
+            dwidth = bbx[0] + bbx[2]
+        return FontFileGlyph(name, encoding, bbx, dwidth, data)
+
+
+_PCF_PROPERTIES = 1 << 0
+_PCF_METRICS = 1 << 2
+_PCF_BITMAPS = 1 << 3
+_PCF_BDF_ENCODINGS = 1 << 5
+_PCF_GLYPH_NAMES = 1 << 7
+
+_PCF_COMPRESSED_METRICS = 0x100
+_PCF_BYTE_MASK = 1 << 2
+_PCF_BIT_MASK = 1 << 3
+
+_reversedbits = bytearray(
+    int("{:08b}".format(b)[::-1], 2) for b in range(256))
+
+
+class PCFFile(object):
+    """PCF file reader.
+
+    Metrics, encodings and names are read on construction; the bitmap of
+    each glyph is read from the file while iterating.
+    """
+
+    def __init__(self, f):
+        self._file = f
+        if f.read(4) != b"\x01fcp":
+            raise FontFileError("not a PCF file")
+        count, = struct.unpack("<i", f.read(4))
+        self._toc = {}
+        for i in range(count):
+            tabletype, fmt, size, offset = struct.unpack("<iiii", f.read(16))
+            self._toc[tabletype] = (fmt, offset)
+
+        for tabletype in (_PCF_METRICS, _PCF_BITMAPS, _PCF_BDF_ENCODINGS):
+            if tabletype not in self._toc:
+                raise FontFileError("required table is missing in PCF file")
+
+        self.properties = self._readProperties()
+        self._metrics = self._readMetrics()
+        self._encodings = self._readEncodings()
+        self._names = self._readNames()
+        self.numGlyphs = len(self._metrics)
+
+    def _seekTable(self, tabletype):
+        fmt, offset = self._toc[tabletype]
+        self._file.seek(offset)
+        fmt, = struct.unpack("<i", self._file.read(4))
+        return fmt, ">" if fmt & _PCF_BYTE_MASK else "<"
+
+    def _unpack(self, fmt, count=1):
+        size = struct.calcsize(fmt[0] + fmt[1:] * count)
+        return struct.unpack(fmt[0] + fmt[1:] * count, self._file.read(size))
+
+    def _readStrings(self, endian):
+        size, = self._unpack(endian + "i")
+        return self._file.read(size)
+
+    @staticmethod
+    def _getString(strings, offset):
+        return strings[offset:strings.index(b"\0", offset)].decode("latin-1")
+
+    def _readProperties(self):
+        if _PCF_PROPERTIES not in self._toc:
+            return {}
+        fmt, e = self._seekTable(_PCF_PROPERTIES)
+        nprops, = self._unpack(e + "i")
+        props = [self._unpack(e + "ibi") for i in range(nprops)]
+        if nprops & 3:
+            self._file.read(4 - (nprops & 3))
+        strings = self._readStrings(e)
+        properties = {}
+        for nameoffset, isstring, value in props:
+            if isstring:
+                value = self._getString(strings, value)
+            properties[self._getString(strings, nameoffset)] = value
+        return properties
+
+    def _readMetrics(self):
+        fmt, e = self._seekTable(_PCF_METRICS)
+        if fmt & _PCF_COMPRESSED_METRICS:
+            count, = self._unpack(e + "h")
+            values = self._unpack("<B", count * 5)
+            values = [v - 0x80 for v in values]
+            return [values[i:i + 5] for i in range(0, count * 5, 5)]
+        count, = self._unpack(e + "i")
+        values = self._unpack(e + "hhhhhH", count)
+        return [values[i:i + 5] for i in range(0, count * 6, 6)]
+
+    def _readEncodings(self):
+        fmt, e = self._seekTable(_PCF_BDF_ENCODINGS)
+        mincol, maxcol, minrow, maxrow, defaultchar = self._unpack(e + "hhhhh")
+        ncols = maxcol - mincol + 1
+        indices = self._unpack(
+            e + "H", ncols * (maxrow - minrow + 1))
+        encodings = {}
+        for i, index in enumerate(indices):
+            if index != 0xFFFF:
+                encodings.setdefault(
+                    index, (minrow + i // ncols) << 8 | (mincol + i % ncols))
+        return encodings
+
+    def _readNames(self):
+        if _PCF_GLYPH_NAMES not in self._toc:
+            return None
+        fmt, e = self._seekTable(_PCF_GLYPH_NAMES)
+        count, = self._unpack(e + "i")
+        offsets = self._unpack(e + "i", count)
+        strings = self._readStrings(e)
+        return [self._getString(strings, offset) for offset in offsets]
+
+    def __iter__(self):
+        try:
+            fmt, e = self._seekTable(_PCF_BITMAPS)
+            count, = self._unpack(e + "i")
+            offsets = self._unpack(e + "i", count)
+            self._unpack(e + "iiii")
+            start = self._file.tell()
+
+            pad = 1 << (fmt & 3)
+            unit = 1 << ((fmt >> 4) & 3)
+            lsbit = not fmt & _PCF_BIT_MASK
+            swap = unit > 1 and bool(fmt & _PCF_BYTE_MASK) != bool(fmt & _PCF_BIT_MASK)
+
+            for i, (lsb, rsb, width, ascent, descent) in enumerate(self._metrics):
+                w = rsb - lsb
+                h = ascent + descent
+                rowsize = (w + 7) // 8
+                paddedsize = (w + pad * 8 - 1) // (pad * 8) * pad
+                self._file.seek(start + offsets[i])
+                raw = bytearray(self._file.read(paddedsize * h))
+                if swap:
+                    for j in range(0, len(raw), unit):
+                        raw[j:j + unit] = raw[j:j + unit][::-1]
+                if lsbit:
+                    raw = bytearray(_reversedbits[b] for b in raw)
+                data = bytearray()
+                for y in range(h):
+                    data += raw[y * paddedsize:y * paddedsize + rowsize]
+                if self._names is not None:
+                    name = self._names[i]
+                else:
+                    name = "glyph{}".format(i)
+                yield FontFileGlyph(
+                    name, self._encodings.get(i, -1),
+                    (w, h, lsb, -descent), width, data)
+        finally:
+            self._file.close()
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+
+# Measures what the glyphs of a built font cost to render: the charstring
+# operators executed (in the subroutines too), the subroutine calls and
+# their depth, and the time to draw them through a fontTools pen.  With a
+# size in ppem, the outlines are also flattened into edges as a scanline
+# rasterizer would, counting the edges and the scanlines they cross.
+# TrueType (glyf) fonts are measured by their points and components (and
+# the nesting of them) instead of operators and subroutine calls.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import json
+import math
+import sys
+import timeit
+
+from fontTools.misc.psCharStrings import T2OutlineExtractor
+from fontTools.pens.basePen import BasePen
+from fontTools.pens.recordingPen import RecordingPen
+from fontTools.ttLib import TTFont
+
+PY2 = sys.version_info < (3, 0)
+
+if not PY2:
+    basestring = str
+
+
+class CountingExtractor(T2OutlineExtractor):
+    """Outline extractor that counts the operators it executes."""
+
+    def reset(self):
+        T2OutlineExtractor.reset(self)
+        self.operators = 0
+        self.calls = 0
+        self.depth = 0
+        self.maxDepth = 0
+
+    def execute(self, charString):
+        self.depth += 1
+        self.maxDepth = max(self.maxDepth, self.depth)
+        T2OutlineExtractor.execute(self, charString)
+        self.depth -= 1
+        # charstrings have no branches: every operator is executed once
+        for token in charString.program:
+            if isinstance(token, basestring):
+                self.operators += 1
+                if token in ("callsubr", "callgsubr"):
+                    self.calls += 1
+
+
+class EdgeCountingPen(BasePen):
+    """Pen that flattens the outlines into edges at a scale, and counts the
+    edges that are not horizontal and the scanlines they cross."""
+
+    # length in pixels of the pieces curves are flattened into
+    curveStep = 2.0
+
+    def __init__(self, glyphSet, scale):
+        BasePen.__init__(self, glyphSet)
+        self.scale = scale
+        self.contours = 0
+        self.edges = 0
+        self.crossings = 0
+        self._start = None
+
+    def _addEdge(self, p0, p1):
+        y0 = int(math.floor(p0[1] * self.scale + 0.5))
+        y1 = int(math.floor(p1[1] * self.scale + 0.5))
+        if y0 != y1:
+            self.edges += 1
+            self.crossings += abs(y1 - y0)
+
+    def _moveTo(self, pt):
+        self.contours += 1
+        self._start = pt
+
+    def _lineTo(self, pt):
+        self._addEdge(self._getCurrentPoint(), pt)
+
+    def _curveToOne(self, pt1, pt2, pt3):
+        pt0 = self._getCurrentPoint()
+        length = sum(math.hypot(b[0] - a[0], b[1] - a[1])
+                     for a, b in [(pt0, pt1), (pt1, pt2), (pt2, pt3)])
+        steps = max(1, int(math.ceil(length * self.scale / self.curveStep)))
+        last = pt0
+        for i in range(1, steps + 1):
+            t = i / steps
+            s = 1 - t
+            pt = tuple(s * s * s * a + 3 * s * s * t * b + 3 * s * t * t * c +
+                       t * t * t * d
+                       for a, b, c, d in zip(pt0, pt1, pt2, pt3))
+            self._addEdge(last, pt)
+            last = pt
+
+    def _closePath(self):
+        self._addEdge(self._getCurrentPoint(), self._start)
+
+
+def measureGlyph(charString, glyphSet=None, ppem=None, unitsPerEm=1000,
+                 repeat=3):
+    """Returns the cost of rendering the charstring as a dict."""
+    extractors = []
+
+    def outlineExtractor(*args, **kwargs):
+        extractor = CountingExtractor(*args, **kwargs)
+        extractors.append(extractor)
+        return extractor
+
+    charString.outlineExtractor = outlineExtractor
+    try:
+        charString.draw(RecordingPen())
+    finally:
+        del charString.outlineExtractor
+    extractor = extractors[0]
+    res = {
+        "operators": extractor.operators,
+        "calls": extractor.calls,
+        "depth": extractor.maxDepth - 1,
+        # the best of some runs, in seconds
+        "time": min(timeit.repeat(lambda: charString.draw(RecordingPen()),
+                                  number=1, repeat=repeat)),
+    }
+    if ppem is not None:
+        pen = EdgeCountingPen(glyphSet, ppem / unitsPerEm)
+        charString.draw(pen)
+        res["contours"] = pen.contours
+        res["edges"] = pen.edges
+        res["crossings"] = pen.crossings
+    return res
+
+
+def _componentCounts(glyfTable, name):
+    """Returns (points, components, depth) of a glyf glyph, counting the
+    points and components of the glyphs its components refer to."""
+    glyph = glyfTable[name]
+    if not glyph.isComposite():
+        if not glyph.numberOfContours:
+            return 0, 0, 0
+        return len(glyph.getCoordinates(glyfTable)[0]), 0, 0
+    points = components = depth = 0
+    for component in glyph.components:
+        p, c, d = _componentCounts(glyfTable, component.glyphName)
+        points += p
+        components += c + 1
+        depth = max(depth, d + 1)
+    return points, components, depth
+
+
+def measureTTGlyph(name, glyphSet, glyfTable, ppem=None, unitsPerEm=1000,
+                   repeat=3):
+    """Returns the cost of rendering the glyf glyph as a dict."""
+    points, components, depth = _componentCounts(glyfTable, name)
+    glyph = glyphSet[name]
+    res = {
+        "points": points,
+        "calls": components,
+        "depth": depth,
+        "time": min(timeit.repeat(lambda: glyph.draw(RecordingPen()),
+                                  number=1, repeat=repeat)),
+    }
+    if ppem is not None:
+        pen = EdgeCountingPen(glyphSet, ppem / unitsPerEm)
+        glyph.draw(pen)
+        res["contours"] = pen.contours
+        res["edges"] = pen.edges
+        res["crossings"] = pen.crossings
+    return res
+
+
+def benchmark(path, ppem=None, repeat=3):
+    """Returns the costs of rendering the glyphs of the font: a dict with
+    the "glyphs" (a list of the costs of each glyph with its "name") and
+    the "total" of each cost.  Raises ValueError if the font has neither
+    CFF nor glyf outlines."""
+    font = TTFont(path)
+    unitsPerEm = font["head"].unitsPerEm
+    glyphs = []
+    if "CFF " in font:
+        charStrings = font["CFF "].cff.topDictIndex[0].CharStrings
+        for name in font.getGlyphOrder():
+            res = measureGlyph(charStrings[name], charStrings, ppem,
+                               unitsPerEm, repeat)
+            res["name"] = name
+            glyphs.append(res)
+    elif "glyf" in font:
+        glyphSet = font.getGlyphSet()
+        for name in font.getGlyphOrder():
+            res = measureTTGlyph(name, glyphSet, font["glyf"], ppem,
+                                 unitsPerEm, repeat)
+            res["name"] = name
+            glyphs.append(res)
+    else:
+        raise ValueError("{}: the font has no CFF or glyf outlines".format(path))
+
+    total = {}
+    for key in ["operators", "points", "calls", "time", "contours", "edges",
+                "crossings"]:
+        if glyphs and key in glyphs[0]:
+            total[key] = sum(g[key] for g in glyphs)
+    total["depth"] = max([g["depth"] for g in glyphs] or [0])
+    return {"font": path, "ppem": ppem, "glyphs": glyphs, "total": total}
+
+
+def _printReport(res, top=10, perGlyph=False):
+    glyphs = res["glyphs"]
+    total = res["total"]
+    n = max(len(glyphs), 1)
+    # operators and subroutine calls of CFF, or points and components
+    # of glyf
+    cff = "points" not in total
+    size = "operators" if cff else "points"
+    print("{}: {} glyphs".format(res["font"], len(glyphs)))
+    print("  {:11s} {:10d}  ({:.1f} per glyph)".format(
+        size, total.get(size, 0), total.get(size, 0) / n))
+    print("  {:11s} {:10d}  ({:.1f} per glyph, depth up to {})".format(
+        "subr calls" if cff else "components", total.get("calls", 0),
+        total.get("calls", 0) / n, total["depth"]))
+    print("  draw time   {:10.2f} ms  ({:.1f} us per glyph)".format(
+        total["time"] * 1e3, total["time"] * 1e6 / n))
+    if res["ppem"] is not None:
+        print("  edges       {:10d}  ({:.1f} per glyph, {} contours)".format(
+            total["edges"], total["edges"] / n, total["contours"]))
+        print("  crossings   {:10d}  (scanlines crossed at {} ppem)".format(
+            total["crossings"], res["ppem"]))
+
+    if perGlyph:
+        print("  glyphs:")
+    elif top:
+        print("  most expensive glyphs:")
+        glyphs = sorted(glyphs, key=lambda g: -g[size])[:top]
+    else:
+        return
+    for g in glyphs:
+        line = "    {:20s} {:6d} {} {:5d} {} depth {} {:8.1f} us".format(
+            g["name"], g[size], "ops" if cff else "pts", g["calls"],
+            "calls" if cff else "comps", g["depth"], g["time"] * 1e6)
+        if res["ppem"] is not None:
+            line += " {:6d} edges {:6d} crossings".format(
+                g["edges"], g["crossings"])
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the cost of rendering the glyphs of OpenType (CFF or glyf) fonts.")
+    parser.add_argument("fonts", nargs="+", metavar="FONT.otf")
+    parser.add_argument("--ppem", type=float,
+                        help="also flatten the outlines into edges at this size")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="draws of each glyph to take the best time of (default: %(default)s)")
+    parser.add_argument("--top", type=int, default=10,
+                        help="number of the most expensive glyphs to show (default: %(default)s)")
+    parser.add_argument("--glyphs", action="store_true",
+                        help="show every glyph")
+    parser.add_argument("--json", action="store_true",
+                        help="write the results as JSON")
+    args = parser.parse_args()
+    try:
+        results = [benchmark(path, args.ppem, args.repeat)
+                   for path in args.fonts]
+    except ValueError as e:
+        parser.error(str(e))
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        for res in results:
+            _printReport(res, args.top, args.glyphs)
@@ -5,6 +5,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import copy
 from functools import reduce
 import sys
 
@@ -103,6 +104,23 @@ class Bitmap(object):
         self.voriginy = voriginy
         for r in bitmap:
             assert len(r) == self.width
+        self._invalidate()
+
+    def copy(self):
+        """Returns a copy that shares the rows (and the values derived from
+        them) with this bitmap until either of them is changed.  Methods
+        replace rows instead of changing them in place."""
+        other = copy.copy(self)
+        other.bitmap = list(self.bitmap)
+        return other
+
+    def _invalidate(self):
+        # drop the values derived from the pixels; every method that changes
+        # the bitmap or its origin must call this
+        self._dots = None
+        self._polygons = None
+        self._bbox = None
+        self._key = None
 
     def makebold(self, options={}):
         boldtype = options.get("boldtype", 0)
@@ -125,6 +143,7 @@ class Bitmap(object):
         self.advanceWidth += x
         self.advanceHeight += y
         self.voriginy += y
+        self._invalidate()
 
     def _makebold_x(self, boldtype=0, align=False):
         self.bitmap = [_makebold_row[boldtype](
@@ -137,6 +156,9 @@ class Bitmap(object):
         slanttoleft = cotangent < 0
         abscotangent = abs(cotangent)
 
+        # the rows may be shared with copies
+        self.bitmap = [list(row) for row in self.bitmap]
+
         y = 0
         while y < self.height:
             for i in range(self.height):
@@ -151,11 +173,13 @@ class Bitmap(object):
 
         self.width = len(self.bitmap[0])
         self.origin = (ox, oy)
+        self._invalidate()
 
     def translate(self, xy=(0, 0)):
         x, y = xy
         ox, oy = self.origin
         self.origin = (ox - x, oy - y)
+        self._invalidate()
 
     def rotate(self, n=1):
         assert isinstance(n, int)
@@ -165,11 +189,10 @@ class Bitmap(object):
         if n == 0:
             return
         if n == 2:
-            self.bitmap.reverse()
-            for r in self.bitmap:
-                r.reverse()
+            self.bitmap = [r[::-1] for r in reversed(self.bitmap)]
             self.origin = (
                 self.width - self.origin[0], self.height - self.origin[1])
+            self._invalidate()
             return
 
         if n == 1:
@@ -183,6 +206,7 @@ class Bitmap(object):
 
         self.width, self.height = self.height, self.width
         self.advanceWidth, self.advanceHeight = self.advanceHeight, self.advanceWidth
+        self._invalidate()
 
     def scale(self, x=1, y=1):
         assert x >= 0 and y >= 0
@@ -199,6 +223,7 @@ class Bitmap(object):
         self.advanceHeight *= y
         self.voriginy *= y
         self.origin = (self.origin[0] * x, self.origin[1] * y)
+        self._invalidate()
 
     def _scaley(self, sy):
         if sy == 1:
@@ -213,28 +238,45 @@ class Bitmap(object):
         self.bitmap = newbmp
         self.height = len(newbmp)
 
+    def getDots(self):
+        """Returns the list of (x, y) of the dots, relative to the origin."""
+        if self._dots is None:
+            ox, oy = self.origin
+            self._dots = [(x - ox, y - oy)
+                          for y, row in enumerate(self.bitmap)
+                          for x, b in enumerate(row) if b]
+        return self._dots
+
+    def getDotCount(self):
+        return len(self.getDots())
+
     def dotiter(self):
-        for y in range(self.height):
-            for x in range(self.width):
-                if self.bitmap[y][x]:
-                    yield (x - self.origin[0], y - self.origin[1])
+        return iter(self.getDots())
 
     def getBoundingBox(self):
-        INFINITY = float("inf")
-        minX = +INFINITY
-        minY = +INFINITY
-        maxX = -INFINITY
-        maxY = -INFINITY
-        for x, y in self.dotiter():
-            minX = min(minX, x)
-            minY = min(minY, y)
-            maxX = max(maxX, x)
-            maxY = max(maxY, y)
-
-        if minX == +INFINITY:
-            return (0, 0, 0, 0)
-
-        return (minX, minY, maxX, maxY)
+        if self._bbox is None:
+            dots = self.getDots()
+            if not dots:
+                self._bbox = (0, 0, 0, 0)
+            else:
+                xs = [x for x, y in dots]
+                ys = [y for x, y in dots]
+                self._bbox = (min(xs), min(ys), max(xs), max(ys))
+        return self._bbox
+
+    def getKey(self):
+        """Returns a hashable value made of the pixels and the metrics.
+        Bitmaps that look the same have equal keys."""
+        if self._key is None:
+            self._key = (
+                tuple(tuple(bool(b) for b in row) for row in self.bitmap),
+                self.width, self.height, tuple(self.origin),
+                self.advanceWidth, self.advanceHeight, self.voriginy)
+        return self._key
+
+    def getHash(self):
+        """Returns a hash of the pixels and the metrics."""
+        return hash(self.getKey())
 
     def getPixel(self, x, y):
         x += self.origin[0]
@@ -249,6 +291,13 @@ class Bitmap(object):
         return self.bitmap[y][x]
 
     def toPolygons(self):
+        """Returns the contours of the bitmap as lists of vertices relative
+        to the origin.  They are traced once and shared by later calls."""
+        if self._polygons is None:
+            self._polygons = self._tracePolygons()
+        return self._polygons
+
+    def _tracePolygons(self):
         vertices = []
 
         for y in range(self.height + 1):
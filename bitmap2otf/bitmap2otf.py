@@ -5,25 +5,41 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import argparse
+import binascii
 from collections import Counter
+import copy
+from functools import partial
+import hashlib
+import io
+import json
+import logging
+import os.path
 import sys
+import time
 
-from fontTools.misc.psCharStrings import T2CharString
-from fontTools.misc.timeTools import timestampNow
-from fontTools import ttLib
-from fontTools.ttLib.tables._c_m_a_p import cmap_classes
-from fontTools.ttLib.tables._n_a_m_e import NameRecord
-from fontTools.ttLib.tables.BitmapGlyphMetrics import BigGlyphMetrics
-from fontTools.ttLib.tables.E_B_D_T_ import ebdt_bitmap_classes
-from fontTools.ttLib.tables.E_B_L_C_ import eblc_sub_table_classes
+# fontTools and multiprocessing are imported where they are used, so that
+# the command line starts quickly, especially to only check a config.
 
+from bitmapfont import getXAvgCharWidth
+from bitmapfont import isFixedPitch
 from config import Config
+from config import ConfigFileError
+from config import invalidateFileCaches
 from dotshape import _intorfloat
+from dotshape import _pixelOutline
+from dotshape import getSubroutineNumbers
+from progress import BuildProgress
+from subroutinizer import subroutinize
+
+log = logging.getLogger(__name__)
 
 version = "0.1.0"
 
 
 def addcmap(cmap, code, vs, name, gid):
+    from fontTools.ttLib.tables._c_m_a_p import cmap_classes
+
     for subtable in cmap.tables:
         if vs != -1:
             if isinstance(subtable, cmap_classes[14]):
@@ -38,16 +54,18 @@ def addcmap(cmap, code, vs, name, gid):
 
 
 def getBitmapMetrics(bitmap, vertBearingX=0):
+    from fontTools.ttLib.tables.BitmapGlyphMetrics import BigGlyphMetrics
+
     metrics = BigGlyphMetrics()
-    metrics.height = int(bitmap.height)
-    metrics.width = int(bitmap.width)
-    metrics.horiBearingX = -int(bitmap.origin[0])
-    metrics.horiBearingY = int(bitmap.height - bitmap.origin[1])
-    metrics.horiAdvance = int(bitmap.advanceWidth)
+    metrics.height = int(bitmap["height"])
+    metrics.width = int(bitmap["width"])
+    metrics.horiBearingX = -int(bitmap["origin"][0])
+    metrics.horiBearingY = int(bitmap["height"] - bitmap["origin"][1])
+    metrics.horiAdvance = int(bitmap["advanceWidth"])
     metrics.vertBearingX = vertBearingX
     metrics.vertBearingY = int(
-        bitmap.voriginy - bitmap.height + bitmap.origin[1])
-    metrics.vertAdvance = int(bitmap.advanceHeight)
+        bitmap["voriginy"] - bitmap["height"] + bitmap["origin"][1])
+    metrics.vertAdvance = int(bitmap["advanceHeight"])
     return metrics
 
 
@@ -67,27 +85,316 @@ def updatesbitLineMetrics(metrics, bst):
                               metrics.vertBearingX - metrics.width)
 
 
-def main(configfilepath):
-    cfg = Config(configfilepath)
-    f = cfg.toBitmapFont()
+def importTemplate(otf, template):
+    """Imports a TTX template given as a path, as the XML bytes or as a
+    parsed TTFont, whose tables are copied."""
+    from fontTools import ttLib
+
+    if isinstance(template, ttLib.TTFont):
+        for tag in template.keys():
+            if tag != "GlyphOrder":
+                otf[tag] = copy.deepcopy(template[tag])
+        return
+    if isinstance(template, (bytes, bytearray)):
+        template = io.BytesIO(template)
+    otf.importXML(template)
+
+
+def _copyTables(src, otf):
+    """Copies the tables of src into otf, whose glyphs are those of src in
+    the same order but may have other names, replacing the tables with the
+    same tags.  They are copied in the binary form, which refers to the
+    glyphs by their ids."""
+    from fontTools import ttLib
+
+    for tag in src.keys():
+        if tag == "GlyphOrder":
+            continue
+        table = ttLib.newTable(tag)
+        table.decompile(src.getTableData(tag), otf)
+        otf[tag] = table
+
+
+def _importRenamedTemplate(otf, template, glyphNames):
+    """Imports a TTX template written with other names of the glyphs of otf
+    (glyphNames, in the glyph order)."""
+    from fontTools import ttLib
+
+    named = ttLib.TTFont()
+    named.setGlyphOrder(glyphNames)
+    importTemplate(named, template)
+    _copyTables(named, otf)
+
+
+def _setupCIDKeyed(cff, topDict, cidCfg, numGlyphs):
+    """Turns the name-keyed CFF of the template into a CID-keyed one whose
+    glyphs all use a single font dict, and returns the private dict of it
+    (the one of the template)."""
+    from fontTools.cffLib import FDArrayIndex
+    from fontTools.cffLib import FDSelect
+    from fontTools.cffLib import FontDict
+
+    private = topDict.Private
+    del topDict.Private
+    if hasattr(topDict, "Encoding"):
+        del topDict.Encoding
+    topDict.ROS = (cidCfg["registry"], cidCfg["ordering"],
+                   cidCfg["supplement"])
+    topDict.CIDCount = numGlyphs
+
+    fontDict = FontDict()
+    # the FontMatrix of the top dict does the scaling
+    fontDict.FontMatrix = [1, 0, 0, 1, 0, 0]
+    fontDict.Private = private
+    fdArray = topDict.FDArray = FDArrayIndex()
+    fdArray.strings = None
+    fdArray.GlobalSubrs = cff.GlobalSubrs
+    fdArray.append(fontDict)
+
+    fdSelect = topDict.FDSelect = FDSelect()
+    fdSelect.format = 3
+    fdSelect.gidArray = [0] * numGlyphs
+    return private
+
+
+def _setupGlyf(otf, glyphOrder):
+    """Replaces the CFF outlines of the template with empty glyf and loca
+    tables, and returns the glyf table."""
+    from fontTools.ttLib import newTable
+
+    for tag in ["CFF ", "VORG"]:
+        if tag in otf:
+            del otf[tag]
+    otf.sfntVersion = "\0\1\0\0"
+    glyfTable = otf["glyf"] = newTable("glyf")
+    glyfTable.glyphs = {}
+    glyfTable.glyphOrder = glyphOrder
+    otf["loca"] = newTable("loca")
+    otf["head"].glyphDataFormat = 0
+
+    maxpTable = otf["maxp"]
+    maxpTable.tableVersion = 0x00010000
+    # the maxima of the glyphs are computed when the font is saved
+    for key in ["maxPoints", "maxContours", "maxCompositePoints",
+                "maxCompositeContours", "maxTwilightPoints", "maxStorage",
+                "maxFunctionDefs", "maxInstructionDefs", "maxStackElements",
+                "maxSizeOfInstructions", "maxComponentElements",
+                "maxComponentDepth"]:
+        setattr(maxpTable, key, 0)
+    maxpTable.maxZones = 2
+
+    # keep the glyph names
+    postTable = otf["post"]
+    postTable.formatType = 2.0
+    postTable.extraNames = []
+    postTable.mapping = {}
+    return glyfTable
+
+
+def _makeTTGlyph(contours, components, dotNames):
+    from fontTools.pens.ttGlyphPen import TTGlyphPointPen
+    from fontTools.ttLib.tables._g_l_y_f import Glyph
+
+    if not contours and not components:
+        return Glyph()
+    # the names the components may refer to
+    pen = TTGlyphPointPen(set(dotNames))
+    for contour in contours:
+        pen.beginPath()
+        for x, y, onCurve in contour:
+            pen.addPoint((x, y), "line" if onCurve else None)
+        pen.endPath()
+    for x, y, variant in components:
+        pen.addComponent(dotNames[variant], (1, 0, 0, 1, x, y))
+    return pen.glyph()
+
+
+class CompiledGlyph(object):
+    """Glyph compiled into a charstring program (or TrueType contours and
+    components), a bounding box and bitmap data, which is all that is
+    needed to assemble the font."""
+
+    def __init__(self, name, codepoint, vs, metrics, charstring, bbx, imageData=None,
+                 contours=None, components=None):
+        self.name = name
+        self.codepoint = codepoint
+        self.vs = vs
+        # width, height, origin, advanceWidth, advanceHeight and voriginy of
+        # the bitmap in dots
+        self.metrics = metrics
+        # charstring program without the width and endchar
+        self.charstring = charstring
+        self.bbx = bbx
+        self.imageData = imageData
+        # for TrueType outlines (then charstring is None): lists of (x, y,
+        # onCurve), and the components that draw a dot as (x, y, variant)
+        self.contours = contours
+        self.components = components
+
+    def toJSON(self):
+        obj = {
+            "name": self.name,
+            "codepoint": self.codepoint,
+            "vs": self.vs,
+            "metrics": self.metrics,
+            "charstring": self.charstring,
+            "bbx": self.bbx,
+        }
+        if self.imageData is not None:
+            obj["imageData"] = binascii.hexlify(self.imageData).decode("ascii")
+        if self.contours is not None:
+            obj["contours"] = self.contours
+            obj["components"] = self.components
+        return obj
+
+    @classmethod
+    def fromJSON(cls, obj):
+        metrics = dict(obj["metrics"])
+        metrics["origin"] = tuple(metrics["origin"])
+        imageData = obj.get("imageData")
+        if imageData is not None:
+            imageData = binascii.unhexlify(imageData)
+        contours = obj.get("contours")
+        if contours is not None:
+            contours = [[tuple(p) for p in contour] for contour in contours]
+        components = obj.get("components")
+        if components is not None:
+            components = [tuple(p) for p in components]
+        return cls(obj["name"], obj["codepoint"], obj["vs"], metrics,
+                   obj["charstring"], obj["bbx"], imageData,
+                   contours, components)
+
+
+_bitmapMetricsKeys = ("width", "height", "origin",
+                      "advanceWidth", "advanceHeight", "voriginy")
+
+
+def compileGlyph(g, shape, dw, dh, subrns, generateBitmap=False,
+                 outlineFormat="cff"):
+    bitmap = g.bitmap
+    metrics = dict((key, getattr(bitmap, key)) for key in _bitmapMetricsKeys)
+    metrics["origin"] = tuple(metrics["origin"])
+    if outlineFormat == "bitmap":
+        # no outlines; the bounding box of the pixels
+        return CompiledGlyph(
+            g.name, g.codepoint, g.vs, metrics, None,
+            _pixelOutline.getGlyphBBX(bitmap, dw, dh),
+            bitmap.toImageData(), [], [])
+    if outlineFormat == "truetype":
+        # straight from the traced polygons, without charstrings
+        contours, components = shape.bitmap2contours(bitmap, dw, dh)
+        return CompiledGlyph(
+            g.name, g.codepoint, g.vs, metrics, None,
+            shape.getContoursBBX(contours, components, dw, dh),
+            bitmap.toImageData() if generateBitmap else None,
+            contours, components)
+    return CompiledGlyph(
+        g.name, g.codepoint, g.vs, metrics,
+        shape.bitmap2charstring(bitmap, dw, dh, subrns),
+        shape.getGlyphBBX(bitmap, dw, dh),
+        bitmap.toImageData() if generateBitmap else None)
+
+
+def compileGlyphs(cfg, glyphs, cache=None, progress=None):
+    """Compiles the glyphs.  If cache (a dict) is given, glyphs that look the
+    same as ones compiled before with the same outline settings are taken
+    from it.  progress is a BuildProgress."""
+    dw, dh = cfg.outlineCfg["dotSize"]
+    outlineFormat = cfg.outlineCfg["format"]
+    if outlineFormat == "bitmap":
+        shape = _pixelOutline
+        subrns = []
+    else:
+        shape = cfg.shape()
+        subrns = getSubroutineNumbers(shape.getSubroutines(dw, dh))
+    if progress is not None:
+        glyphs = progress.iterate("compile", glyphs)
+    if cache is None:
+        return [compileGlyph(g, shape, dw, dh, subrns, cfg.generateBitmap,
+                             outlineFormat)
+                for g in glyphs]
+
+    shapeKey = (shape.getKey(), dw, dh, cfg.generateBitmap, outlineFormat)
+    compiled = []
+    for g in glyphs:
+        key = (shapeKey, g.bitmap.getKey())
+        c = cache.get(key)
+        if c is None:
+            c = cache[key] = compileGlyph(
+                g, shape, dw, dh, subrns, cfg.generateBitmap, outlineFormat)
+        compiled.append(CompiledGlyph(
+            g.name, g.codepoint, g.vs, c.metrics, c.charstring, c.bbx, c.imageData,
+            c.contours, c.components))
+    return compiled
+
+
+def loadTemplates(templates):
+    from fontTools import ttLib
+
     otf = ttLib.TTFont()
-    for path in cfg.templates:
-        otf.importXML(path)
+    for template in templates:
+        importTemplate(otf, template)
+    return otf
+
+
+def buildFont(cfg, glyphs, otf=None):
+    """Assembles the font from the templates and the compiled glyphs.
+
+    otf, if given, is used in place of a font loaded from cfg.templates.
+    """
+    from fontTools.misc.psCharStrings import T2CharString
+    from fontTools.misc.timeTools import timestampNow
+    from fontTools.misc.timeTools import timestampSinceEpoch
+    from fontTools.ttLib.tables._n_a_m_e import NameRecord
+    from fontTools.ttLib.tables.E_B_D_T_ import ebdt_bitmap_classes
+    from fontTools.ttLib.tables.E_B_L_C_ import eblc_sub_table_classes
+
+    if otf is None:
+        otf = loadTemplates(cfg.templates)
 
     dw, dh = cfg.outlineCfg["dotSize"]
+    # bitmap-only fonts have empty glyf outlines
+    truetype = cfg.outlineCfg["format"] in ("truetype", "bitmap")
 
     glyphOrder = []
     otf.setGlyphOrder(glyphOrder)
 
-    cff = otf["CFF "].cff
-    cffTopDict = cff.topDictIndex[0]
-    cffCharStrings = cffTopDict.CharStrings.charStrings = {}
-    cffSubrs = cffTopDict.Private.Subrs
-    cffSubrs.items = []
+    if truetype:
+        glyfTable = _setupGlyf(otf, glyphOrder)
+        if cfg.outlineCfg["format"] == "bitmap":
+            # keep the bounding boxes of the bitmaps in head and hhea
+            # (and maxp as it is) instead of the empty outlines'
+            otf.recalcBBoxes = False
+        glyphNames = [g.name for g in glyphs]
+        # the glyphs of a dot (and of its variants) that the glyphs drawn
+        # by components refer to
+        dotNames = []
+        variantCount = max(
+            [c[2] + 1 for g in glyphs for c in g.components or []] or [0])
+        names = set(glyphNames)
+        for variant in range(variantCount):
+            dotName = ".dot" if variant == 0 else ".dot.{}".format(variant)
+            while dotName in names:
+                dotName += "_"
+            dotNames.append(dotName)
+    else:
+        cff = otf["CFF "].cff
+        cffTopDict = cff.topDictIndex[0]
+        cffCharStrings = cffTopDict.CharStrings.charStrings = {}
+        if cfg.cidCfg is not None:
+            private = _setupCIDKeyed(cff, cffTopDict, cfg.cidCfg, len(glyphs))
+            # glyphs are named by their CIDs, which are the glyph ids
+            glyphNames = [".notdef"] + [
+                "cid{:05d}".format(i) for i in range(1, len(glyphs))]
+        else:
+            private = cffTopDict.Private
+            glyphNames = [g.name for g in glyphs]
+        cffSubrs = private.Subrs
+        cffSubrs.items = []
 
-    counts = Counter(g.bitmap.advanceWidth for g in f.glyphs).most_common(2)
-    defaultWidthX = cffTopDict.Private.defaultWidthX = counts[0][0] * dw
-    nominalWidthX = cffTopDict.Private.nominalWidthX = counts[-1][0] * dw
+        counts = Counter(g.metrics["advanceWidth"] for g in glyphs).most_common(2)
+        defaultWidthX = private.defaultWidthX = counts[0][0] * dw
+        nominalWidthX = private.nominalWidthX = counts[-1][0] * dw
 
     hmtxTable = otf["hmtx"]
     hmtxTable.metrics = {}
@@ -99,7 +406,7 @@ def main(configfilepath):
     if "VORG" in otf:
         vorgTable = otf["VORG"]
         vorgTable.VOriginRecords = {}
-        counts = Counter(g.bitmap.voriginy for g in f.glyphs).most_common(1)
+        counts = Counter(g.metrics["voriginy"] for g in glyphs).most_common(1)
         vorgTable.defaultVertOriginY = int(counts[0][0] * dh)
     else:
         vorgTable = None
@@ -108,7 +415,7 @@ def main(configfilepath):
 
     INFINITY = float("inf")
 
-    bitmap = cfg.generateBitmap
+    bitmap = cfg.generateBitmap or cfg.outlineCfg["format"] == "bitmap"
     if bitmap:
         bst = otf["EBLC"].strikes[0].bitmapSizeTable
         eblcIndexSubTables = otf["EBLC"].strikes[0].indexSubTables = []
@@ -137,48 +444,55 @@ def main(configfilepath):
     maxYExtent = -INFINITY
 
     shape = cfg.shape()
-
-    subrs = shape.getSubroutines(dw, dh)
-    subrl = len(subrs)
-    if subrl < 1240:
-        bias = 107
-    elif subrl < 33900:
-        bias = 1131
-    else:
-        bias = 32768
-
-    subrns = range(-bias, subrl - bias)
+    subrs = [] if truetype else shape.getSubroutines(dw, dh)
 
     for subr in subrs:
-        charstring = T2CharString()
+        charstring = T2CharString(
+            private=private, globalSubrs=cff.GlobalSubrs)
         charstring.fromXML("CharString", {}, subr + " return")
         cffSubrs.append(charstring)
 
+    charstrings = [g.charstring for g in glyphs]
+    if cfg.outlineCfg.get("subroutinize", False) and not truetype:
+        charstrings, gsubrs = subroutinize(charstrings)
+        cff.GlobalSubrs.items = []
+        for subr in gsubrs:
+            charstring = T2CharString(
+                private=private, globalSubrs=cff.GlobalSubrs)
+            charstring.fromXML("CharString", {}, subr + " return")
+            cff.GlobalSubrs.append(charstring)
+
     curIndexSubTable = None
 
-    for i, g in enumerate(f.glyphs):
-        glyphOrder.append(g.name)
+    for i, g in enumerate(glyphs):
+        name = glyphNames[i]
+        glyphOrder.append(name)
         if g.codepoint != -1:
-            addcmap(cmap, g.codepoint, g.vs, g.name, i)
+            addcmap(cmap, g.codepoint, g.vs, name, i)
 
-        aw = g.bitmap.advanceWidth * dw
-        ah = g.bitmap.advanceHeight * dh
-        if aw != defaultWidthX:
-            w = "{} ".format(_intorfloat(aw - nominalWidthX))
+        aw = g.metrics["advanceWidth"] * dw
+        ah = g.metrics["advanceHeight"] * dh
+        if truetype:
+            glyfTable.glyphs[name] = _makeTTGlyph(
+                g.contours, g.components, dotNames)
         else:
-            w = ""
-        charstring = T2CharString()
-        charstring.fromXML(
-            "CharString", {}, w + shape.bitmap2charstring(g.bitmap, dw, dh, subrns) + " endchar")
-        cffCharStrings[g.name] = charstring
-
-        bbx = shape.getGlyphBBX(g.bitmap, dw, dh)
-        hmtxTable[g.name] = (int(aw), int(bbx[0]))
-        vorgy = g.bitmap.voriginy * dh
+            if aw != defaultWidthX:
+                w = "{} ".format(_intorfloat(aw - nominalWidthX))
+            else:
+                w = ""
+            charstring = T2CharString(
+                private=private, globalSubrs=cff.GlobalSubrs)
+            charstring.fromXML(
+                "CharString", {}, w + charstrings[i] + " endchar")
+            cffCharStrings[name] = charstring
+
+        bbx = g.bbx
+        hmtxTable[name] = (int(aw), int(bbx[0]))
+        vorgy = g.metrics["voriginy"] * dh
         if vmtxTable is not None:
-            vmtxTable[g.name] = (int(ah), int(vorgy - bbx[3]))
+            vmtxTable[name] = (int(ah), int(vorgy - bbx[3]))
         if vorgTable is not None:
-            vorgTable[g.name] = int(vorgy)
+            vorgTable[name] = int(vorgy)
         fontBBX = [
             min(fontBBX[0], bbx[0]),
             min(fontBBX[1], bbx[1]),
@@ -193,7 +507,7 @@ def main(configfilepath):
         maxYExtent = max(maxYExtent, vorgy - bbx[1])
 
         if bitmap:
-            if i + 1 < len(f.glyphs) and g.bitmap.hasSameMetrics(f.glyphs[i + 1].bitmap):
+            if i + 1 < len(glyphs) and g.metrics == glyphs[i + 1].metrics:
                 if curIndexSubTable is not None and curIndexSubTable.indexFormat == 2:
                     nextIndexSubTable = curIndexSubTable
                 else:
@@ -204,9 +518,9 @@ def main(configfilepath):
                     curIndexSubTable.names = []
                     eblcIndexSubTables.append(curIndexSubTable)
 
-                    curIndexSubTable.imageSize = g.bitmap.getImageDataSize()
+                    curIndexSubTable.imageSize = len(g.imageData)
                     curIndexSubTable.metrics = getBitmapMetrics(
-                        g.bitmap, vertBearingX)
+                        g.metrics, vertBearingX)
                     updatesbitLineMetrics(curIndexSubTable.metrics, bst)
 
                     nextIndexSubTable = curIndexSubTable
@@ -231,16 +545,27 @@ def main(configfilepath):
                 ebdtBitmap = ebdt_bitmap_classes[5](None, otf)
             else:
                 ebdtBitmap = ebdt_bitmap_classes[7](None, otf)
-                ebdtBitmap.metrics = getBitmapMetrics(g.bitmap, vertBearingX)
+                ebdtBitmap.metrics = getBitmapMetrics(g.metrics, vertBearingX)
                 updatesbitLineMetrics(ebdtBitmap.metrics, bst)
 
-            ebdtBitmap.imageData = g.bitmap.toImageData()
+            ebdtBitmap.imageData = g.imageData
 
-            ebdtGlyphDict[g.name] = ebdtBitmap
-            curIndexSubTable.names.append(g.name)
+            ebdtGlyphDict[name] = ebdtBitmap
+            curIndexSubTable.names.append(name)
 
             curIndexSubTable = nextIndexSubTable
 
+    if truetype:
+        # last, not to move the glyphs the layout tables refer to
+        for variant, dotName in enumerate(dotNames):
+            contours = shape.getDotContours(dw, dh, variant)
+            glyphOrder.append(dotName)
+            glyfTable.glyphs[dotName] = _makeTTGlyph(contours, [], [])
+            hmtxTable[dotName] = (
+                0, shape.getContoursBBX(contours, [], dw, dh)[0])
+            if vmtxTable is not None:
+                vmtxTable[dotName] = (0, 0)
+
     if fontBBX[0] == +INFINITY:
         fontBBX = [0, 0, 0, 0]
         maxAW = 0
@@ -255,13 +580,20 @@ def main(configfilepath):
 
     headTable = otf["head"]
     headTable.unitsPerEm = int((ascent + descent) * dh)
-    headTable.created = headTable.modified = timestampNow()
+    if cfg.timestamp is None:
+        headTable.created = headTable.modified = timestampNow()
+    else:
+        headTable.created = headTable.modified = timestampSinceEpoch(
+            cfg.timestamp)
+        # keep it when saving
+        otf.recalcTimestamp = False
     headTable.xMin, headTable.yMin, headTable.xMax, headTable.yMax = [
         int(v) for v in fontBBX]
     headTable.lowestRecPPEM = int(ascent + descent)
 
     os_2Table = otf["OS/2"]
-    os_2Table.xAvgCharWidth = f.getXAvgCharWidth(dw=dw)
+    os_2Table.xAvgCharWidth = getXAvgCharWidth(
+        ((g.codepoint, g.metrics["advanceWidth"]) for g in glyphs), dw=dw)
     os_2Table.recalcUnicodeRanges(otf)
     os_2Table.sTypoAscender = int(ascent * dh)
     os_2Table.sTypoDescender = -int(descent * dh)
@@ -289,7 +621,7 @@ def main(configfilepath):
     hheaTable.minLeftSideBearing = int(fontBBX[0])
     hheaTable.minRightSideBearing = int(minRSB)
     hheaTable.xMaxExtent = int(fontBBX[2])
-    hheaTable.numberOfHMetrics = len(f.glyphs)
+    hheaTable.numberOfHMetrics = len(glyphOrder)
 
     nameTable = otf["name"]
     for namerecords in cfg.fontinfo.names:
@@ -306,25 +638,37 @@ def main(configfilepath):
                     nameRecord.langID = langID
                 nameRecord.string = string.encode(nameRecord.getEncoding())
 
-    cffNames = f.fontinfo.getCFFNames()
-    cff.fontNames[0] = cffNames[6]  # 6 = PostScript name
-    if 5 in cffNames:  # 5 = Version
-        cffTopDict.version = cffNames[5]
-    if 0 in cffNames:  # 0 = Copyright
-        cffTopDict.Copyright = cffNames[0]
-    if 4 in cffNames:  # 4 = Full name
-        cffTopDict.FullName = cffNames[4]
-    if 1 in cffNames:  # 1 = Font Family
-        cffTopDict.FamilyName = cffNames[1]
-
-    otf["post"].isFixedPitch = cffTopDict.isFixedPitch = f.isFixedPitch()
-    mtxValue = 1.0 / ((ascent + descent) * dh)
-
-    # Fix for macOS Font Book
-    mtxValue = round(mtxValue, 16)
-
-    cffTopDict.FontMatrix = [mtxValue, 0, 0, mtxValue, 0, 0]
-    cffTopDict.FontBBox = fontBBX
+    isFixed = otf["post"].isFixedPitch = isFixedPitch(
+        g.metrics["advanceWidth"] for g in glyphs)
+
+    if not truetype:
+        cffNames = cfg.fontinfo.getCFFNames()
+        cff.fontNames[0] = cffNames[6]  # 6 = PostScript name
+        if cfg.cidCfg is not None:
+            cffTopDict.FDArray[0].FontName = cffNames[6] + "-Generic"
+            if cfg.cidCfg["glyphNames"]:
+                postTable = otf["post"]
+                postTable.formatType = 2.0
+                postTable.extraNames = []
+                postTable.mapping = dict(
+                    (name, g.name) for name, g in zip(glyphNames, glyphs))
+        if 5 in cffNames:  # 5 = Version
+            cffTopDict.version = cffNames[5]
+        if 0 in cffNames:  # 0 = Copyright
+            cffTopDict.Copyright = cffNames[0]
+        if 4 in cffNames:  # 4 = Full name
+            cffTopDict.FullName = cffNames[4]
+        if 1 in cffNames:  # 1 = Font Family
+            cffTopDict.FamilyName = cffNames[1]
+
+        cffTopDict.isFixedPitch = isFixed
+        mtxValue = 1.0 / ((ascent + descent) * dh)
+
+        # Fix for macOS Font Book
+        mtxValue = round(mtxValue, 16)
+
+        cffTopDict.FontMatrix = [mtxValue, 0, 0, mtxValue, 0, 0]
+        cffTopDict.FontBBox = fontBBX
 
     if "vhea" in otf:
         vheaTable = otf["vhea"]
@@ -334,7 +678,7 @@ def main(configfilepath):
         vheaTable.minTopSideBearing = int(minTSB)
         vheaTable.minBottomSideBearing = int(minBSB)
         vheaTable.yMaxExtent = int(maxYExtent)
-        vheaTable.numberOfVMetrics = len(f.glyphs)
+        vheaTable.numberOfVMetrics = len(glyphOrder)
 
     if bitmap:
         bst.hori.ascender = int(ascent)
@@ -356,24 +700,628 @@ def main(configfilepath):
             bst.vert.minAfterBL = 0
 
         bst.startGlyphIndex = 0
-        bst.endGlyphIndex = len(f.glyphs) - 1
+        bst.endGlyphIndex = len(glyphs) - 1
         bst.ppemY = int(ascent + descent)
         bst.ppemX = int((ascent + descent) * dh / dw)
 
-    for path in cfg.templateTTX2:
-        otf.importXML(path)
+    for template in cfg.templateTTX2:
+        if cfg.cidCfg is not None:
+            _importRenamedTemplate(otf, template, [g.name for g in glyphs])
+        else:
+            importTemplate(otf, template)
+
+    return otf
+
+
+class BuildCache(object):
+    """What is kept between builds in a long-lived process: parsed templates
+    and compiled glyphs.  Decoded images are kept by config.getImage."""
+
+    def __init__(self, maxGlyphs=500000):
+        self.templates = {}
+        self.glyphs = {}
+        self.maxGlyphs = maxGlyphs
+
+    def _templateKey(self, template):
+        from fontTools import ttLib
+
+        if isinstance(template, (bytes, bytearray)):
+            return bytes(template)
+        if isinstance(template, ttLib.TTFont):
+            # not kept: its owner may change it
+            return None
+        st = os.stat(template)
+        return (template, st.st_mtime, st.st_size)
+
+    def getTemplateFont(self, templates):
+        key = tuple(self._templateKey(t) for t in templates)
+        if None in key:
+            return loadTemplates(templates)
+        if key not in self.templates:
+            self.templates[key] = loadTemplates(templates)
+        return copy.deepcopy(self.templates[key])
+
+    def getGlyphCache(self):
+        if len(self.glyphs) > self.maxGlyphs:
+            self.glyphs.clear()
+        return self.glyphs
+
+
+def buildVariants(cfg, bitmapfont, cache=None, progress=None):
+    """Yields (config, TTFont) for each variant of the config.  The glyphs
+    of bitmapfont (made by cfg.toBitmapFont) are shared by all the
+    variants.
+
+    If cache (a BuildCache) is given, compiled glyphs are kept in it.
+    progress is a BuildProgress.
+    """
+    variants = cfg.getVariants()
+    compiledVariants = compileVariants(cfg, bitmapfont, cache, progress)
+    if cache is None:
+        cache = BuildCache()
+    for i, (vcfg, compiled) in enumerate(compiledVariants, 1):
+        otf = buildFont(
+            vcfg, compiled, otf=cache.getTemplateFont(vcfg.templates))
+        if progress is not None:
+            progress.report("font", i, len(variants))
+        yield vcfg, otf
+
+
+def compileVariants(cfg, bitmapfont, cache=None, progress=None):
+    """Yields (config, compiled glyphs) for each variant of the config, as
+    buildVariants builds them, for saving the fonts with their slices."""
+    glyphcache = None if cache is None else cache.getGlyphCache()
+    for vcfg in cfg.getVariants():
+        f = vcfg.forkBitmapFont(bitmapfont, progress=progress)
+        yield vcfg, compileGlyphs(vcfg, f.glyphs, cache=glyphcache,
+                                  progress=progress)
+
+
+def _saveVariant(shared, index):
+    cfg, bitmapfont, progress = shared
+    vcfg = cfg.getVariants()[index]
+    f = vcfg.forkBitmapFont(bitmapfont, progress=progress)
+    compiled = compileGlyphs(vcfg, f.glyphs, progress=progress)
+    if vcfg.slices:
+        saveSlices(vcfg, compiled, progress)
+    else:
+        buildFont(vcfg, compiled).save(vcfg.outputTo)
+
+
+def saveVariants(cfg, bitmapfont, progress=None):
+    """Builds and saves the font of each variant of the config, and the
+    slices of them.
+
+    Where processes can be forked, the variants are built in parallel by
+    forked processes, which share the glyphs of bitmapfont with this
+    process copy-on-write.  The slices of a font are built in parallel in
+    the same way, so then the variants are built one by one.  With a
+    progress (a BuildProgress), which forked processes could not report
+    to, everything is built one by one in this process.
+    """
+    variants = cfg.getVariants()
+    shared = (cfg, bitmapfont, progress)
+    if cfg.slices or progress is not None:
+        for i in range(len(variants)):
+            _saveVariant(shared, i)
+            if progress is not None:
+                progress.report("font", i + 1, len(variants))
+    else:
+        _forkMap(_saveVariant, shared, list(range(len(variants))))
+
+
+def getSliceOutput(output, name):
+    """Returns where the slice of the font saved to output is saved."""
+    root, ext = os.path.splitext(output)
+    return "{}.{}{}".format(root, name, ext)
+
+
+_SLICE_SUBSET_OPTIONS = dict(
+    layout_features=["*"], layout_scripts=["*"], name_IDs=["*"],
+    name_languages=["*"], name_legacy=True, glyph_names=True,
+    notdef_outline=True)
+
+
+def buildSlice(cfg, glyphs, ranges):
+    """Builds a subset of the font of the compiled glyphs (all the glyphs of
+    the font, in order) for the codepoints in ranges, a list of (start, end).
+
+    It has .notdef, the glyphs of the codepoints and the ones they are
+    substituted with by the layout tables of the ttx_after templates.  Only
+    the codepoints in ranges are mapped.  (A copied glyph has outlines of
+    its own, so the glyph it is copied from is not needed.)
+    """
+    from fontTools import ttLib
+    from fontTools.subset import Options
+    from fontTools.subset import Subsetter
+
+    def inRanges(g):
+        return g.codepoint != -1 and \
+            any(start <= g.codepoint <= end for start, end in ranges)
+
+    names = set([".notdef"])
+    found = [g.name for g in glyphs if inRanges(g)]
+    glyphNames = [g.name for g in glyphs]
+    layout = None
+    while found:
+        names.update(found)
+        found = []
+        if cfg.templateTTX2:
+            # the layout tables are subset apart from the compiled glyphs
+            layout = ttLib.TTFont()
+            layout.setGlyphOrder(glyphNames)
+            for template in cfg.templateTTX2:
+                importTemplate(layout, template)
+            subsetter = Subsetter(Options(**_SLICE_SUBSET_OPTIONS))
+            subsetter.populate(glyphs=names)
+            subsetter.subset(layout)
+            found = [name for name in layout.getGlyphOrder()
+                     if name not in names]
+
+    scfg = copy.copy(cfg)
+    scfg.templateTTX2 = []
+    otf = buildFont(scfg, [
+        g if inRanges(g) else CompiledGlyph(
+            g.name, -1, g.vs, g.metrics, g.charstring, g.bbx, g.imageData,
+            g.contours, g.components)
+        for g in glyphs if g.name in names])
+    if layout is not None:
+        _copyTables(layout, otf)
+    return otf
+
+
+# the function run by _forkMap and what the processes forked by it inherit
+_forkedBuild = None
+
+
+def _runForked(arg):
+    func, shared = _forkedBuild
+    return func(shared, arg)
+
+
+def _forkMap(func, shared, args):
+    """Calls func(shared, arg) for each of args, in parallel by forked
+    processes, which share shared with this process copy-on-write, where
+    processes can be forked."""
+    import multiprocessing
+
+    global _forkedBuild
+    if len(args) == 1 or not hasattr(os, "fork"):
+        for arg in args:
+            func(shared, arg)
+        return
+
+    if hasattr(multiprocessing, "get_context"):
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing
+    _forkedBuild = (func, shared)
+    try:
+        pool = context.Pool(min(len(args), multiprocessing.cpu_count()))
+        try:
+            pool.map(_runForked, args)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        _forkedBuild = None
+
+
+def _saveSlice(shared, index):
+    cfg, glyphs, progress = shared
+    if progress is not None:
+        progress.check()
+    if index is None:
+        buildFont(cfg, glyphs).save(cfg.outputTo)
+    else:
+        sliceCfg = cfg.slices[index]
+        otf = buildSlice(cfg, glyphs, sliceCfg["ranges"])
+        otf.save(getSliceOutput(cfg.outputTo, sliceCfg["name"]))
+
+
+def saveSlices(cfg, glyphs, progress=None, parallel=True):
+    """Builds and saves the font of the compiled glyphs and its slices, in
+    parallel where processes can be forked, unless parallel is false or a
+    progress is reported."""
+    indices = [None] + list(range(len(cfg.slices)))
+    if progress is not None or not parallel:
+        for index in indices:
+            _saveSlice((cfg, glyphs, progress), index)
+    else:
+        _forkMap(_saveSlice, (cfg, glyphs, None), indices)
+
+
+def saveCompiled(cfg, glyphs, cache=None, parallel=True):
+    """Builds and saves the font of the compiled glyphs of a variant, and
+    its slices (see saveSlices), and returns the paths of the saved fonts.
+    The template is taken from cache (a BuildCache) if given."""
+    if cfg.slices:
+        saveSlices(cfg, glyphs, parallel=parallel)
+        return [cfg.outputTo] + [getSliceOutput(cfg.outputTo, sliceCfg["name"])
+                                 for sliceCfg in cfg.slices]
+    otf = None if cache is None else cache.getTemplateFont(cfg.templates)
+    buildFont(cfg, glyphs, otf=otf).save(cfg.outputTo)
+    return [cfg.outputTo]
+
+
+def build(config, resources=None, progress=None):
+    """Builds the font and returns it as a TTFont.
+
+    config is a path to a config file or a config object; see Config for
+    resources, which lets the whole build run without reading any file.
+    progress is a BuildProgress, to follow the build and to cancel it.
+    A config with several variants is built by buildVariants.
+    """
+    cfg = Config(config, resources)
+    if len(cfg.getVariants()) > 1:
+        raise ValueError("the config has several variants")
+    f = cfg.toBitmapFont(progress=progress)
+    vcfg = cfg.getVariants()[0]
+    f = vcfg.forkBitmapFont(f, progress=progress)
+    otf = buildFont(vcfg, compileGlyphs(vcfg, f.glyphs, progress=progress))
+    if progress is not None:
+        progress.report("font", 1, 1)
+    return otf
+
+
+def buildBytes(config, resources=None, progress=None):
+    """Builds the font and returns the bytes of the font file."""
+    buf = io.BytesIO()
+    build(config, resources, progress).save(buf)
+    return buf.getvalue()
+
+
+def getInputHash(cfg):
+    """Returns a hash of everything a font built from the config file
+    depends on: the files, the timestamp and the versions of the tools."""
+    from fontTools import version as fontToolsVersion
+
+    h = hashlib.sha256()
+    h.update("{}\0{}\0{}\0".format(
+        version, fontToolsVersion, cfg.timestamp).encode("utf-8"))
+    configdirpath = os.path.dirname(cfg.configfilepath)
+    for path in cfg.getDependencies():
+        with open(path, "rb") as f:
+            data = f.read()
+        h.update("{}\0{}\0".format(
+            os.path.relpath(path, configdirpath or "."), len(data)).encode("utf-8"))
+        h.update(data)
+    return h.hexdigest()
+
+
+def check(configfilepath):
+    """Returns the problems found in the config, without reading the images
+    or building the font (see Config.check)."""
+    try:
+        cfg = Config(configfilepath)
+    except (ConfigFileError, IOError, ValueError) as e:
+        return ["{}: {}".format(type(e).__name__, e)]
+    return cfg.check()
+
+
+def main(configfilepath, progress=None, quick=False):
+    """Builds and saves the fonts of the config file.  progress is a
+    BuildProgress; a cancelled build raises BuildCancelled and leaves the
+    fonts not saved yet as they were.  quick builds bitmap-only fonts, to
+    look at the glyphs."""
+    cfg = Config(configfilepath)
+    if quick:
+        cfg.setOutlineFormat("bitmap")
+
+    outputs = _getOutputs(cfg)
+
+    # In a reproducible build, the hash of the inputs is recorded next to
+    # the outputs, and the build is skipped if it is unchanged.
+    inputHash = None
+    if cfg.timestamp is not None and not quick:
+        inputHash = getInputHash(cfg)
+        if all(_readInputHash(output) == inputHash for output in outputs):
+            log.info("'{}' is up to date".format("', '".join(outputs)))
+            return
+
+    f = cfg.toBitmapFont(progress=progress)
+    saveVariants(cfg, f, progress)
+    writeInputHashes(outputs, inputHash)
+
+
+def _getOutputs(cfg):
+    """Returns the paths of the fonts a build of the config saves."""
+    outputs = []
+    for vcfg in cfg.getVariants():
+        outputs.append(vcfg.outputTo)
+        outputs.extend(getSliceOutput(vcfg.outputTo, sliceCfg["name"])
+                       for sliceCfg in cfg.slices)
+    return outputs
+
+
+def writeInputHashes(outputs, inputHash=None):
+    """Records the hash of the inputs the saved outputs were built from,
+    or, with no hash, removes the record so that a later reproducible
+    build does not take them as up to date.  Every build that saves fonts
+    must call this."""
+    for output in outputs:
+        hashpath = output + ".inputhash"
+        if inputHash is not None:
+            with open(hashpath, "w") as hf:
+                hf.write(inputHash + "\n")
+        elif os.path.exists(hashpath):
+            os.remove(hashpath)
+
+
+def _printProgress(stage, done, total, elapsed):
+    sys.stderr.write("{}: {}/{} ({:.1f}s)\n".format(stage, done, total, elapsed))
+
+
+def _readInputHash(output):
+    hashpath = output + ".inputhash"
+    if not (os.path.exists(output) and os.path.exists(hashpath)):
+        return None
+    with open(hashpath, "r") as f:
+        return f.read().strip()
+
+
+# Watch mode
+
+def _fileState(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+def _fileHash(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+def _watchBuild(configfilepath, cache, changed=None, quick=False):
+    start = time.time()
+    invalidateFileCaches()
+    cfg = Config(configfilepath)
+    if quick:
+        cfg.setOutlineFormat("bitmap")
+
+    if changed is None:
+        affected = len(cfg.glyphsources)
+    else:
+        sourcefiles = set()
+        for glyphsrc in cfg.glyphsources:
+            sourcefiles.update(glyphsrc.files)
+        if any(path not in sourcefiles for path in changed):
+            # the config, a template or the dot shape
+            affected = len(cfg.glyphsources)
+        else:
+            affected = sum(
+                1 for glyphsrc in cfg.glyphsources
+                if any(path in changed for path in glyphsrc.files))
+
+    f = cfg.toBitmapFont()
+    numCached = len(cache.getGlyphCache())
+    for vcfg, compiled in compileVariants(cfg, f, cache):
+        saveCompiled(vcfg, compiled, cache)
+    writeInputHashes(_getOutputs(cfg))
+
+    print("{}: {}/{} glyph sources affected, {}/{} glyphs compiled ({:.3f}s)".format(
+        ", ".join(vcfg.outputTo for vcfg in cfg.getVariants()),
+        affected, len(cfg.glyphsources),
+        len(cache.getGlyphCache()) - numCached,
+        len(f.glyphs) * len(cfg.getVariants()), time.time() - start))
+    return cfg.getDependencies()
+
+
+def watch(configfilepath, interval=0.5, quick=False):
+    """Builds the font and rebuilds it whenever the config or a file it
+    depends on changes, until interrupted.  quick builds bitmap-only fonts.
+
+    Files are polled by mtime and size, and a change is confirmed by the
+    hash of the content.  Compiled glyphs are kept between builds, so only
+    the glyphs whose bitmaps (or dot shape) changed are compiled again.
+    """
+    cache = BuildCache()
+    configfilepath = os.path.abspath(configfilepath)
+    changed = None
+    states = {}
+    hashes = {}
+    try:
+        while True:
+            try:
+                paths = _watchBuild(configfilepath, cache, changed, quick)
+            except Exception as e:
+                log.error("build failed: {}: {}".format(type(e).__name__, e))
+                paths = [configfilepath]
+                for path in states:
+                    if path not in paths:
+                        paths.append(path)
+            states = dict((path, _fileState(path)) for path in paths)
+            for path in paths:
+                if path not in hashes:
+                    hashes[path] = _fileHash(path)
+
+            changed = set()
+            while not changed:
+                time.sleep(interval)
+                for path in paths:
+                    state = _fileState(path)
+                    if state == states[path]:
+                        continue
+                    states[path] = state
+                    h = _fileHash(path)
+                    if h != hashes[path]:
+                        hashes[path] = h
+                        changed.add(path)
+            print("changed: {}".format(", ".join(
+                os.path.relpath(path) for path in sorted(changed))))
+    except KeyboardInterrupt:
+        pass
+
+
+# Sharded build
+#
+# A manifest splits the glyph sources into contiguous shards.  Each shard
+# can be compiled by a separate process (or on a separate machine sharing
+# the files) into an artifact of compiled glyphs, and the artifacts are
+# merged into the font at the end.
+
+def _readJSON(path):
+    with io.open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _writeJSON(path, obj):
+    with io.open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(obj, ensure_ascii=False))
+
+
+def writeShardManifest(configfilepath, numShards, manifestpath=None):
+    base = os.path.splitext(configfilepath)[0]
+    if manifestpath is None:
+        manifestpath = base + ".shards.json"
+    manifestdirpath = os.path.dirname(manifestpath)
+
+    cfg = Config(configfilepath)
+    shards = []
+    for i, (start, stop) in enumerate(cfg.getShardRanges(numShards)):
+        shards.append({
+            "start": start,
+            "stop": stop,
+            "artifact": os.path.relpath(
+                "{}.shard{}.json".format(base, i), manifestdirpath or "."),
+        })
+    _writeJSON(manifestpath, {
+        "config": os.path.relpath(configfilepath, manifestdirpath or "."),
+        "shards": shards,
+    })
+    return manifestpath
+
+
+def buildShard(manifestpath, index):
+    manifestdirpath = os.path.dirname(manifestpath)
+    manifest = _readJSON(manifestpath)
+    shard = manifest["shards"][index]
+
+    cfg = Config(os.path.join(manifestdirpath, manifest["config"]))
+    f = cfg.toBitmapFont(shard["start"], shard["stop"])
+    _writeJSON(os.path.join(manifestdirpath, shard["artifact"]), {
+        "start": shard["start"],
+        "stop": shard["stop"],
+        # compiled glyphs of each outline variant
+        "variants": [[g.toJSON() for g in compileGlyphs(
+            vcfg, vcfg.forkBitmapFont(f, sharded=True).glyphs)]
+            for vcfg in cfg.getVariants()],
+    })
+
+
+def _mergeArtifacts(artifactGlyphs):
+    glyphs = []
+    names = set()
+    codepoints = set()
+    for objs in artifactGlyphs:
+        for obj in objs:
+            g = CompiledGlyph.fromJSON(obj)
+            # same as BitmapFont.appendGlyph
+            if g.name in names:
+                log.info("there is already a glyph with name '{}' in the font and the new glyph was not added.".format(
+                    g.name))
+                continue
+            if g.codepoint != -1 and (g.codepoint, g.vs) in codepoints:
+                log.info("there is already a glyph with codepoint U+{:04X} in the font and the new glyph was not added.".format(
+                    g.codepoint))
+                continue
+            names.add(g.name)
+            if g.codepoint != -1:
+                codepoints.add((g.codepoint, g.vs))
+            glyphs.append(g)
+    return glyphs
+
+
+def mergeShards(manifestpath):
+    manifestdirpath = os.path.dirname(manifestpath)
+    manifest = _readJSON(manifestpath)
+    cfg = Config(os.path.join(manifestdirpath, manifest["config"]))
+    variants = cfg.getVariants()
+
+    artifacts = []
+    for shard in manifest["shards"]:
+        artifact = _readJSON(os.path.join(manifestdirpath, shard["artifact"]))
+        if (artifact["start"], artifact["stop"]) != (shard["start"], shard["stop"]) or \
+                len(artifact["variants"]) != len(variants):
+            raise ValueError(
+                "artifact '{}' is not for this manifest".format(shard["artifact"]))
+        artifacts.append(artifact)
+
+    cache = BuildCache()
+    for i, vcfg in enumerate(variants):
+        glyphs = _mergeArtifacts(a["variants"][i] for a in artifacts)
+        if vcfg.slices:
+            saveSlices(vcfg, glyphs)
+            continue
+        otf = buildFont(vcfg, glyphs, otf=cache.getTemplateFont(vcfg.templates))
+        otf.save(vcfg.outputTo)
+    writeInputHashes(_getOutputs(cfg))
+
+
+def buildSharded(configfilepath, numShards):
+    import multiprocessing
 
-    otf.save(cfg.outputTo)
+    manifestpath = writeShardManifest(configfilepath, numShards)
+    numShards = len(_readJSON(manifestpath)["shards"])
+    pool = multiprocessing.Pool(numShards)
+    try:
+        pool.map(partial(buildShard, manifestpath), range(numShards))
+    finally:
+        pool.close()
+        pool.join()
+    mergeShards(manifestpath)
 
 
 if __name__ == "__main__":
-    args = sys.argv[1:]
-    if not args:
-        print("""\
-usage: {} CONFIG-FILE.xml...
-
-Bitmap2OTF {}: Generate (name-keyed) OpenType font file from bitmap images.
-""".format(sys.argv[0], version))
-        sys.exit(1)
-    for arg in args:
-        main(arg)
+    parser = argparse.ArgumentParser(
+        description="Bitmap2OTF {}: Generate (name-keyed) OpenType font file from bitmap images.".format(version))
+    parser.add_argument("files", nargs="+", metavar="CONFIG-FILE.json",
+                        help="config files, or shard manifests with --shard and --merge")
+    parser.add_argument("--shards", type=int, metavar="N",
+                        help="build each font in N shards run in parallel processes")
+    parser.add_argument("--split", type=int, metavar="N",
+                        help="only write a manifest that splits the font into N shards")
+    parser.add_argument("--shard", type=int, metavar="I",
+                        help="build the shard I of the manifest")
+    parser.add_argument("--merge", action="store_true",
+                        help="merge the built shards of the manifest into the font")
+    parser.add_argument("--watch", action="store_true",
+                        help="rebuild the font whenever its files change")
+    parser.add_argument("--quick", action="store_true",
+                        help="build bitmap-only fonts (with empty outlines), to look at the glyphs")
+    parser.add_argument("--progress", action="store_true",
+                        help="show the progress of the build")
+    parser.add_argument("--check", action="store_true",
+                        help="only check the config files, without building the fonts")
+    args = parser.parse_args()
+    if args.check:
+        failed = False
+        for arg in args.files:
+            for problem in check(arg):
+                print("{}: {}".format(arg, problem))
+                failed = True
+        sys.exit(1 if failed else 0)
+    if args.watch:
+        if len(args.files) != 1:
+            parser.error("--watch takes only one config file")
+        logging.basicConfig()
+        watch(args.files[0], quick=args.quick)
+        sys.exit()
+    for arg in args.files:
+        if args.split is not None:
+            print(writeShardManifest(arg, args.split))
+        elif args.shard is not None:
+            buildShard(arg, args.shard)
+        elif args.merge:
+            mergeShards(arg)
+        elif args.shards is not None:
+            buildSharded(arg, args.shards)
+        else:
+            main(arg, BuildProgress(_printProgress) if args.progress else None,
+                 args.quick)
@@ -5,6 +5,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import bisect
 import logging
 
 from bitmap import Bitmap
@@ -19,7 +20,31 @@ class BitmapFont(object):
         self.outlineCfg = outlineCfg
         self.generateBitmap = generateBitmap
 
-        self.glyphs = list(glyphs)
+        self.glyphs = glyphs
+
+    # The glyphs are indexed by name and by codepoint (and variation
+    # selector), and lazily by sorted codepoints and names for ranges and
+    # prefixes.
+
+    @property
+    def glyphs(self):
+        return self._glyphs
+
+    @glyphs.setter
+    def glyphs(self, glyphs):
+        self._glyphs = []
+        self._byName = {}
+        self._byCodepoint = {}
+        for glyph in glyphs:
+            self._addGlyph(glyph)
+
+    def _addGlyph(self, glyph):
+        self._glyphs.append(glyph)
+        self._byName.setdefault(glyph.name, glyph)
+        if glyph.codepoint != -1:
+            self._byCodepoint.setdefault((glyph.codepoint, glyph.vs), glyph)
+        self._sortedCodepoints = None
+        self._sortedNames = None
 
     def appendGlyph(self, glyph):
         if self.getGlyphByName(glyph.name) is not None:
@@ -35,40 +60,64 @@ class BitmapFont(object):
             log.info(
                 "there is already a glyph with codepoint {} in the font and the new glyph was not added.".format(cpstr))
             return
-        self.glyphs.append(glyph)
+        self._addGlyph(glyph)
 
     def getGlyphByName(self, name):
-        for g in self.glyphs:
-            if g.name == name:
-                return g
-        return None
+        return self._byName.get(name)
 
     def getGlyphByCodepoint(self, codepoint, vs=-1):
-        for g in self.glyphs:
-            if g.codepoint == codepoint and g.vs == vs:
-                return g
-        return None
+        return self._byCodepoint.get((codepoint, vs))
+
+    def getGlyphsInRange(self, start, end):
+        """Returns the glyphs of the codepoints from start to end (inclusive),
+        with any variation selector."""
+        if self._sortedCodepoints is None:
+            glyphs = sorted(self._byCodepoint.values(),
+                            key=lambda g: (g.codepoint, g.vs))
+            self._sortedCodepoints = ([g.codepoint for g in glyphs], glyphs)
+        codepoints, glyphs = self._sortedCodepoints
+        return glyphs[bisect.bisect_left(codepoints, start):
+                      bisect.bisect_right(codepoints, end)]
+
+    def getGlyphsByPrefix(self, prefix):
+        """Returns the glyphs whose names start with prefix."""
+        if self._sortedNames is None:
+            names = sorted(self._byName)
+            self._sortedNames = (names, [self._byName[n] for n in names])
+        names, glyphs = self._sortedNames
+        i = j = bisect.bisect_left(names, prefix)
+        while j < len(names) and names[j].startswith(prefix):
+            j += 1
+        return glyphs[i:j]
 
     # OS/2 table
 
     def getXAvgCharWidth(self, dw=100.0):
-        # this is not the correct way of calculating xAvgCharWidth...
-        aws = [g.bitmap.advanceWidth
-               for g in self.glyphs
-               if 0x61 <= g.codepoint <= 0x7A or g.codepoint == 0x20]
-        if not aws:
-            return 0
-        return int(sum(aws) * dw / len(aws))
+        return getXAvgCharWidth(
+            ((g.codepoint, g.bitmap.advanceWidth) for g in self.glyphs), dw=dw)
 
     # post table
 
     def isFixedPitch(self):
-        nonzeroWidths = [
-            g.bitmap.advanceWidth for g in self.glyphs if g.bitmap.advanceWidth != 0]
-        if not nonzeroWidths:
-            return True
-        w0 = nonzeroWidths[0]
-        return all(w == w0 for w in nonzeroWidths[1:])
+        return isFixedPitch(g.bitmap.advanceWidth for g in self.glyphs)
+
+
+def getXAvgCharWidth(widths, dw=100.0):
+    """widths: iterable of (codepoint, advance width in dots)"""
+    # this is not the correct way of calculating xAvgCharWidth...
+    aws = [aw for codepoint, aw in widths
+           if 0x61 <= codepoint <= 0x7A or codepoint == 0x20]
+    if not aws:
+        return 0
+    return int(sum(aws) * dw / len(aws))
+
+
+def isFixedPitch(advanceWidths):
+    nonzeroWidths = [w for w in advanceWidths if w != 0]
+    if not nonzeroWidths:
+        return True
+    w0 = nonzeroWidths[0]
+    return all(w == w0 for w in nonzeroWidths[1:])
 
 
 class BitmapGlyph(object):
@@ -82,3 +131,6 @@ class BitmapGlyph(object):
             self.bitmap = bitmap
         else:
             self.bitmap = Bitmap(bitmap, *args, **kwargs)
+
+    def copy(self):
+        return BitmapGlyph(self.codepoint, self.vs, self.name, self.bitmap.copy())
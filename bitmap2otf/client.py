@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+# Thin client of the build daemon (daemon.py).  Only the standard library is
+# imported here so that it starts quickly.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import json
+import os.path
+import socket
+import sys
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+DEFAULT_PORT = 8765
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """HTTPConnection over a Unix domain socket."""
+
+    def __init__(self, path, timeout=None):
+        HTTPConnection.__init__(self, "localhost", timeout=timeout)
+        self.socketpath = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            sock.settimeout(self.timeout)
+        sock.connect(self.socketpath)
+        self.sock = sock
+
+
+def request(obj, socketpath=None, port=DEFAULT_PORT):
+    """Sends a build request to the daemon and returns the response
+    object."""
+    if socketpath is not None:
+        conn = UnixHTTPConnection(socketpath)
+    else:
+        conn = HTTPConnection("127.0.0.1", port)
+    try:
+        body = json.dumps(obj).encode("utf-8")
+        conn.request("POST", "/build", body,
+                     {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        return json.loads(response.read().decode("utf-8"))
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build fonts through the Bitmap2OTF build daemon.")
+    parser.add_argument("files", nargs="+", metavar="CONFIG-FILE.json")
+    parser.add_argument("--socket", metavar="PATH",
+                        help="Unix domain socket of the daemon")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="port of the daemon on localhost (default: %(default)s)")
+    args = parser.parse_args()
+
+    status = 0
+    for path in args.files:
+        res = request({"config": os.path.abspath(path)},
+                      socketpath=args.socket, port=args.port)
+        if "error" in res:
+            print("{}: {}".format(path, res["error"]), file=sys.stderr)
+            status = 1
+        else:
+            print("{} ({:.3f}s)".format(", ".join(res["outputs"]), res["time"]))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,18 +5,26 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import base64
+import binascii
+import collections
+import copy
 import json
 import logging
 import os.path
 import re
 import sys
 
-from PIL import Image
-
+from bdf import FontFileError
+from bdf import openFontFile
+from bitmap import Bitmap
 from bitmapfont import BitmapFont
 from bitmapfont import BitmapGlyph
 from dotshape import DotShapeExternal
 from dotshape import DotShapePixelOutline
+from netpbm import NetpbmError
+from netpbm import NetpbmImage
+from netpbm import isNetpbm
 
 log = logging.getLogger(__name__)
 
@@ -69,6 +77,21 @@ class ConfigFileError(Exception):
     pass
 
 
+def _resolve(name, basepath, resources=None):
+    """Returns the in-memory resource called name if any, or the path of the
+    file otherwise."""
+    if resources is not None and name in resources:
+        return resources[name]
+    return os.path.join(basepath, name)
+
+
+def _resolveText(name, basepath, resources=None):
+    res = _resolve(name, basepath, resources)
+    if resources is not None and name in resources and isinstance(res, basestring):
+        res = res.encode("utf-8")
+    return res
+
+
 def getItem(obj, key, objname="object"):
     try:
         return obj[key]
@@ -85,7 +108,7 @@ def _getGlyphGeometricOptions(obj, default={}):
     return res
 
 
-def _getGlyphSlotInfos(obj):
+def _getGlyphSlotInfos(obj, required=True):
     if "chars" in obj:
         i = {"codepoint", "name", "char"}.intersection(obj.keys())
         if i:
@@ -124,6 +147,8 @@ def _getGlyphSlotInfos(obj):
         res.update(chrs[0])
 
     if "name" not in res and "codepoint" not in res:
+        if not required:
+            return None
         raise ConfigFileError(
             "Either 'name', 'codepoint', 'char', 'chars' or 'names' is required in a glyph source object")
 
@@ -132,7 +157,8 @@ def _getGlyphSlotInfos(obj):
 
 def _getEffectTargetInfos(targets):
     res = []
-    keys = {"all_glyphs", "name", "codepoint", "char", "chars", "names"}
+    keys = {"all_glyphs", "name", "codepoint", "char", "chars", "names",
+            "range", "namePrefix", "namePattern"}
 
     if not isinstance(targets, list):
         targets = [targets]
@@ -161,9 +187,52 @@ def _getEffectTargetInfos(targets):
             res.extend(_str2slots(target["chars"]))
         elif key == "names":
             res.extend({"name": name} for name in target["names"])
+        elif key == "range":
+            r = _parseUnicodeRange(target["range"])
+            if r is None:
+                raise ConfigFileError(
+                    "invalid unicode range '{}' in effect target".format(target["range"]))
+            res.append({"range": r})
+        elif key == "namePrefix":
+            res.append({"namePrefix": target["namePrefix"]})
+        elif key == "namePattern":
+            try:
+                # the whole name must match
+                regexp = re.compile(r"(?:{})\Z".format(target["namePattern"]))
+            except re.error as e:
+                raise ConfigFileError(
+                    "invalid name pattern '{}' in effect target: {}".format(target["namePattern"], e))
+            res.append({"namePattern": target["namePattern"], "regexp": regexp})
     return res
 
 
+def _targetMatches(glyph, target):
+    """Returns whether an effect target refers to the glyph (or glyph
+    source)."""
+    if "all_glyphs" in target:
+        return True
+    if "range" in target:
+        start, end = target["range"]
+        return glyph.codepoint != -1 and start <= glyph.codepoint <= end
+    if "namePrefix" in target:
+        return glyph.name.startswith(target["namePrefix"])
+    if "namePattern" in target:
+        return target["regexp"].match(glyph.name) is not None
+    if "name" in target:
+        return glyph.name == target["name"]
+    return glyph.codepoint == target["codepoint"] and glyph.vs == target.get("vs", -1)
+
+
+def _describeTarget(target):
+    if "range" in target:
+        return "U+{:04X}-{:04X}".format(*target["range"])
+    if "namePrefix" in target:
+        return "namePrefix='{}'".format(target["namePrefix"])
+    if "namePattern" in target:
+        return "namePattern='{}'".format(target["namePattern"])
+    return _describeRef(target)
+
+
 _nameKeyword2nameID = {
     "copyright": 0,
     "fontfamily": 1,
@@ -275,18 +344,228 @@ class FontInfo(object):
         return self.cffNames
 
 
+def _mergeFontInfo(base, obj):
+    """Returns the fontInfo object base overridden by obj.  Settings are
+    overridden one by one, and so are the names of the namerecords of the
+    same platformID, platEncID and langID."""
+    def ids(record):
+        return tuple(tuple(v) if isinstance(v, list) else (v, ) for v in (
+            record.get("platformID"), record.get("platEncID"), record.get("langID")))
+
+    merged = dict(base)
+    settings = dict(base.get("settings", {}))
+    settings.update(obj.get("settings", {}))
+    merged["settings"] = settings
+
+    namerecords = [dict(record) for record in base.get("namerecords", [])]
+    for record in obj.get("namerecords", []):
+        for baseRecord in namerecords:
+            if ids(baseRecord) == ids(record):
+                names = dict(baseRecord.get("namerecord", {}))
+                names.update(record.get("namerecord", {}))
+                baseRecord.update(record)
+                baseRecord["namerecord"] = names
+                break
+        else:
+            namerecords.append(record)
+    merged["namerecords"] = namerecords
+    return merged
+
+
+def _parseEffects(effects):
+    res = []
+    effectNames = {"makebold", "makeitalic",
+                   "translate", "rotate", "scale"}
+    for effect in effects:
+        i = effectNames.intersection(effect.keys())
+        if not i:
+            logging.warn("ignoring unknown effect")
+            continue
+        if len(i) > 1:
+            raise ConfigFileError(
+                "multiple effects ({}) cannot be applied at once".format(", ".join(i)))
+        effectName = list(i)[0]
+        effectValue = effect[effectName]
+        targets = _getEffectTargetInfos(getItem(effect, "target"))
+        # glyphs of the targets the effect is not applied to
+        excluded = _getEffectTargetInfos(effect.get("exclude", []))
+        res.append([targets, effectName, effectValue, excluded])
+    return res
+
+
+def _findTargetGlyphs(bitmapfont, target):
+    """Returns the glyphs of the font an effect target refers to, looked up
+    in the indices of the font."""
+    if "all_glyphs" in target:
+        return bitmapfont.glyphs
+    if "range" in target:
+        return bitmapfont.getGlyphsInRange(*target["range"])
+    if "namePrefix" in target:
+        return bitmapfont.getGlyphsByPrefix(target["namePrefix"])
+    if "namePattern" in target:
+        match = target["regexp"].match
+        return [g for g in bitmapfont.glyphs if match(g.name)]
+    if "name" in target:
+        glyph = bitmapfont.getGlyphByName(target["name"])
+    else:
+        glyph = bitmapfont.getGlyphByCodepoint(
+            target["codepoint"], target.get("vs", -1))
+    return [glyph] if glyph is not None else []
+
+
+def _applyEffects(bitmapfont, effects, sharded=False, progress=None):
+    for i, (gopts, effname, effarg, excluded) in enumerate(effects, 1):
+        # targets may overlap; each glyph gets the effect once
+        glyphs = collections.OrderedDict()
+        for gopt in gopts:
+            found = _findTargetGlyphs(bitmapfont, gopt)
+            if not found and not sharded and "all_glyphs" not in gopt:
+                log.warn("glyph to apply effect '{}' ({}) was not found.".format(
+                    effname, _describeTarget(gopt)))
+            for g in found:
+                glyphs[id(g)] = g
+        if excluded:
+            for gopt in excluded:
+                for g in _findTargetGlyphs(bitmapfont, gopt):
+                    glyphs.pop(id(g), None)
+        for glyph in glyphs.values():
+            getattr(glyph.bitmap, effname)(effarg)
+        if progress is not None:
+            progress.report("effects", i, len(effects))
+
+
+def _parseCID(obj):
+    """Returns the settings of the CID-keyed CFF output, or None for the
+    name-keyed one."""
+    if obj is False or obj is None:
+        return None
+    cid = {
+        "registry": "Adobe",
+        "ordering": "Identity",
+        "supplement": 0,
+        # keep the glyph names in the post table
+        "glyphNames": False,
+    }
+    if obj is not True:
+        if not isinstance(obj, dict):
+            raise ConfigFileError("cid must be a boolean or an object")
+        cid.update(obj)
+    if not isinstance(cid["supplement"], int):
+        raise ConfigFileError("cid: supplement must be an integer")
+    return cid
+
+
+_UNICODE_RANGE_RE = re.compile(r"^[Uu]\+([0-9A-Fa-f]{1,6})(?:-([0-9A-Fa-f]{1,6}))?$")
+
+
+def _parseUnicodeRange(r):
+    """Returns (start, end) of a unicode range ("U+0000-00FF", "U+3000",
+    a codepoint or [start, end]), or None if it is not one."""
+    if isinstance(r, basestring):
+        m = _UNICODE_RANGE_RE.match(r.strip())
+        if not m:
+            return None
+        start = int(m.group(1), 16)
+        return (start, int(m.group(2), 16) if m.group(2) else start)
+    if isinstance(r, int):
+        return (r, r)
+    if isinstance(r, (list, tuple)) and len(r) == 2:
+        return tuple(r)
+    return None
+
+
+def _parseSlice(obj):
+    """Parses a slice of the font: its name and the codepoints in it, as
+    a list of unicode ranges ("U+0000-00FF", "U+3000" or [start, end]) or a
+    string of them separated by commas as in CSS."""
+    name = getItem(obj, "name", "slice")
+    unicodes = getItem(obj, "unicodes", "slice")
+    if isinstance(unicodes, basestring):
+        unicodes = unicodes.split(",")
+    ranges = []
+    for r in unicodes:
+        start_end = _parseUnicodeRange(r)
+        if start_end is None:
+            raise ConfigFileError(
+                "invalid unicode range '{}' in slice '{}'".format(r, name))
+        ranges.append(start_end)
+    return {"name": name, "ranges": ranges}
+
+
+def _parseOutline(obj, basepath, resources):
+    outline = {
+        "dotSize": [100, 100],
+        "dotShape": "pixel-outline",
+        # "cff", "truetype" for glyf outlines, or "bitmap" for empty outlines
+        # and the bitmap strike only
+        "format": "cff",
+    }
+    outline.update(obj)
+
+    if outline["format"] not in ("cff", "truetype", "bitmap"):
+        raise ConfigFileError(
+            "unknown outline format '{}'".format(outline["format"]))
+
+    dotshape = outline["dotShape"]
+    if isinstance(dotshape, basestring):
+        if dotshape != "pixel-outline":
+            raise ConfigFileError(
+                "unknown dot shape type '{}'".format(dotshape))
+    else:
+        dotshape = outline["dotShape"] = dict(dotshape)
+        dotshapesrc = getItem(dotshape, "src", "dotShape")
+        if isinstance(dotshapesrc, basestring):
+            dotshapesrc = _resolve(dotshapesrc, basepath, resources)
+            if isinstance(dotshapesrc, (bytes, bytearray)):
+                dotshapesrc = json.loads(dotshapesrc.decode("utf-8"))
+            dotshape["src"] = dotshapesrc
+        dotshape.setdefault("scale", [1.0, 1.0])
+        dotshape.setdefault("maxRun", 1)
+        dotshape.setdefault("merge", False)
+        if dotshape["merge"] and list(dotshape["scale"]) != [1.0, 1.0]:
+            raise ConfigFileError(
+                "dotShape: touching dots can be merged only at scale 1")
+    return outline
+
+
 class Config(object):
-    def __init__(self, configfilepath):
-        configdirpath = os.path.dirname(configfilepath)
+    """Parsed config file.
+
+    configfilepath may also be an already loaded config object, whose
+    relative paths are resolved against basepath.  Files
+    referred to from the config (templates, images, shapes, glyph data and
+    font files) are looked up in resources first, which maps the names used
+    in the config to in-memory objects: template XML as bytes or str, parsed
+    templates (TTFont), PIL images or bitmap.Bitmap objects in place of
+    images, dot shape objects, or the bytes of data and font files.
+    """
+
+    def __init__(self, configfilepath, resources=None, basepath=""):
+        if isinstance(configfilepath, dict):
+            config = copy.deepcopy(configfilepath)
+            configfilepath = None
+            configdirpath = basepath
+        else:
+            configdirpath = os.path.dirname(configfilepath)
+
+            with open(configfilepath, "r") as configfile:
+                config = json.load(configfile)
 
-        with open(configfilepath, "r") as configfile:
-            config = json.load(configfile)
+        if resources is not None:
+            from PIL import Image
+
+            resources = dict(resources)
+            for name, res in resources.items():
+                if isinstance(res, Image.Image):
+                    resources[name] = prepareImage(res)
+        self.resources = resources
+        self.configfilepath = configfilepath
 
         if "ttx" in config:
             templates = config["ttx"]
             if isinstance(templates, basestring):
                 templates = [templates]
-            self.templates = [os.path.join(configdirpath, path)
+            self.templates = [_resolveText(path, configdirpath, resources)
                               for path in templates]
         else:
             # FIXME
@@ -294,30 +573,62 @@ class Config(object):
 
         if "output" in config:
             self.outputTo = os.path.join(configdirpath, config["output"])
-        else:
+        elif configfilepath is not None:
             self.outputTo = os.path.splitext(configfilepath)[0] + ".otf"
+        else:
+            self.outputTo = None
 
         fontinfo = getItem(config, "fontInfo")
         self.fontinfo = FontInfo(fontinfo)
 
-        self.outlineCfg = {
-            "dotSize": [100, 100],
-            "dotShape": "pixel-outline",
-        }
-        self.outlineCfg.update(getItem(config, "outline"))
-
-        dotshape = self.outlineCfg["dotShape"]
-        if isinstance(dotshape, basestring):
-            if dotshape != "pixel-outline":
-                raise ConfigFileError(
-                    "unknown dot shape type '{}'".format(dotshape))
-        else:
-            dotshapesrc = getItem(dotshape, "src", "dotShape")
-            if isinstance(dotshapesrc, basestring):
-                dotshape["src"] = os.path.join(configdirpath, dotshapesrc)
-            dotshape.setdefault("scale", [1.0, 1.0])
+        outline = getItem(config, "outline")
+        self.outlineCfg = _parseOutline(outline, configdirpath, resources)
+
+        # several fonts made from the same glyphs, each with its own output,
+        # outline settings (over the ones in "outline"), font info (over
+        # "fontInfo") and effects (applied after "effects")
+        self.variants = []
+        for variant in config.get("variants", []):
+            variantOutline = dict(outline)
+            variantOutline.update(variant.get("outline", {}))
+            if "fontInfo" in variant:
+                variantFontinfo = FontInfo(
+                    _mergeFontInfo(fontinfo, variant["fontInfo"]))
+            else:
+                variantFontinfo = self.fontinfo
+            self.variants.append({
+                "output": os.path.join(
+                    configdirpath, getItem(variant, "output", "variant")),
+                "outline": _parseOutline(
+                    variantOutline, configdirpath, resources),
+                "fontInfo": variantFontinfo,
+                "effects": _parseEffects(variant.get("effects", [])),
+            })
 
         self.generateBitmap = config.get("bitmap", False)
+        self.cidCfg = _parseCID(config.get("cid", False))
+        outlines = [v["outline"] for v in self.variants] or [self.outlineCfg]
+        if self.cidCfg is not None and any(
+                outline["format"] != "cff" for outline in outlines):
+            raise ConfigFileError("CID-keyed fonts need CFF outlines")
+        # subset fonts written besides the font, for the web
+        self.slices = [_parseSlice(obj) for obj in config.get("slices", [])]
+
+        # fixed timestamp (seconds since 1970-01-01) for reproducible builds
+        self.timestamp = config.get("timestamp")
+        if self.timestamp is None and os.environ.get("SOURCE_DATE_EPOCH"):
+            try:
+                self.timestamp = int(os.environ["SOURCE_DATE_EPOCH"])
+            except ValueError:
+                raise ConfigFileError("invalid SOURCE_DATE_EPOCH")
+        elif self.timestamp is not None and not isinstance(self.timestamp, int):
+            raise ConfigFileError("timestamp must be an integer")
+
+        self.prefetchCfg = {
+            "threads": 4,
+            "memoryLimit": None,  # in megabytes
+        }
+        self.prefetchCfg.update(config.get("prefetch", {}))
 
         glyphsrcs = getItem(config, "glyphs")
         self.glyphsources = []
@@ -327,72 +638,173 @@ class Config(object):
             "space": GlyphSourceSpace,
             "image": GlyphSourceImage,
             "copy": GlyphSourceGlyph,
+            "bdf": GlyphSourceFontFile,
+            "pcf": GlyphSourceFontFile,
         }
         default_geometry = _getGlyphGeometricOptions(glyphsrcs)
         for glyphsrc in getItem(glyphsrcs, "sources", "glyphs object"):
             glyph_settings = _getGlyphGeometricOptions(
                 glyphsrc, default_geometry)
-            glyph_slots = _getGlyphSlotInfos(glyphsrc)
             i = set(source_classes.keys()).intersection(glyphsrc.keys())
             if len(i) != 1:
                 raise ConfigFileError("Invalid glyph source")
             source_type = list(i)[0]
             klass = source_classes[source_type]
+            glyph_slots = _getGlyphSlotInfos(glyphsrc, klass.slotsRequired)
             opts = glyphsrc[source_type]
             glyphs = klass.parse_config(
-                opts, slots=glyph_slots, opts=glyph_settings, basepath=configdirpath)
+                opts, slots=glyph_slots, opts=glyph_settings, basepath=configdirpath,
+                resources=resources)
             self.glyphsources.extend(glyphs)
 
-        self.effects = []
-        effects = config.get("effects", [])
-        effectNames = {"makebold", "makeitalic",
-                       "translate", "rotate", "scale"}
-        for effect in effects:
-            i = effectNames.intersection(effect.keys())
-            if not i:
-                logging.warn("ignoring unknown effect")
-                continue
-            if len(i) > 1:
-                raise ConfigFileError(
-                    "multiple effects ({}) cannot be applied at once".format(", ".join(i)))
-            effectName = list(i)[0]
-            effectValue = effect[effectName]
-            targets = _getEffectTargetInfos(getItem(effect, "target"))
-            self.effects.append([targets, effectName, effectValue])
+        self.effects = _parseEffects(config.get("effects", []))
+        # effects of this variant, applied to a copy of the glyphs
+        self.variantEffects = []
 
         after_templates = config.get("ttx_after", [])
         if isinstance(after_templates, basestring):
             after_templates = [after_templates]
-        self.templateTTX2 = [os.path.join(configdirpath, path)
+        self.templateTTX2 = [_resolveText(path, configdirpath, resources)
                              for path in after_templates]
 
-    def toBitmapFont(self):
+    def getVariants(self):
+        """Returns a config for each outline variant, sharing everything
+        else with this config, or [self] if there are no variants."""
+        if not self.variants:
+            return [self]
+        variants = []
+        for variant in self.variants:
+            cfg = copy.copy(self)
+            cfg.outlineCfg = variant["outline"]
+            cfg.outputTo = variant["output"]
+            cfg.fontinfo = variant["fontInfo"]
+            cfg.variantEffects = variant["effects"]
+            cfg.variants = []
+            variants.append(cfg)
+        return variants
+
+    def setOutlineFormat(self, outlineFormat):
+        """Sets the outline format of all the variants (see _parseOutline),
+        as to build quick bitmap-only fonts."""
+        for outline in [self.outlineCfg] + [v["outline"] for v in self.variants]:
+            outline["format"] = outlineFormat
+
+    def forkBitmapFont(self, bitmapfont, sharded=False, progress=None):
+        """Returns the font of this variant made from bitmapfont (made by
+        toBitmapFont): the glyphs are copied (sharing the bitmaps until
+        they are changed) and the effects of the variant are applied.
+        progress is a BuildProgress."""
+        if not self.variantEffects:
+            return bitmapfont
+        forked = BitmapFont(fontinfo=self.fontinfo, outlineCfg=self.outlineCfg,
+                            generateBitmap=self.generateBitmap,
+                            glyphs=[g.copy() for g in bitmapfont.glyphs])
+        _applyEffects(forked, self.variantEffects, sharded, progress)
+        return forked
+
+    def getDependencies(self):
+        """Returns the paths of the files the font is built from."""
+        paths = []
+        if self.configfilepath is not None:
+            paths.append(self.configfilepath)
+        paths.extend(t for t in self.templates + self.templateTTX2
+                     if isinstance(t, basestring))
+        for cfg in [self] + self.getVariants():
+            dotshape = cfg.outlineCfg["dotShape"]
+            if not isinstance(dotshape, basestring) and isinstance(dotshape["src"], basestring):
+                paths.append(dotshape["src"])
+        for glyphsrc in self.glyphsources:
+            paths.extend(glyphsrc.files)
+
+        seen = set()
+        res = []
+        for path in paths:
+            if path not in seen:
+                seen.add(path)
+                res.append(path)
+        return res
+
+    def prefetchImages(self, glyphsources=None):
+        """Decodes the source images in a thread pool before the glyphs are
+        made from them.  Images over the memory limit are left to be decoded
+        on demand."""
+        if glyphsources is None:
+            glyphsources = self.glyphsources
+        threads = self.prefetchCfg["threads"]
+        srcs = []
+        for glyphsrc in glyphsources:
+            if isinstance(glyphsrc, GlyphSourceImage) and \
+                    isinstance(glyphsrc.src, basestring) and glyphsrc.src not in srcs:
+                srcs.append(glyphsrc.src)
+        if threads <= 1 or len(srcs) <= 1:
+            return
+
+        memoryLimit = self.prefetchCfg["memoryLimit"]
+        if memoryLimit is not None:
+            budget = memoryLimit * 1024 * 1024
+            prefetched = []
+            for src in srcs:
+                size = getImageDecodedSize(src)
+                if size <= budget:
+                    budget -= size
+                    prefetched.append(src)
+            srcs = prefetched
+            if len(srcs) <= 1:
+                return
+
+        from multiprocessing.pool import ThreadPool
+
+        pool = ThreadPool(min(threads, len(srcs)))
+        try:
+            pool.map(loadImage, srcs)
+        finally:
+            pool.close()
+            pool.join()
+
+    def getShardRanges(self, numShards):
+        """Splits the glyph sources into numShards contiguous ranges of
+        (start, stop)."""
+        count = len(self.glyphsources)
+        numShards = max(1, min(numShards, count))
+        return [(count * i // numShards, count * (i + 1) // numShards)
+                for i in range(numShards)]
+
+    def _getCopyContext(self, start, glyphsources):
+        """Returns the glyph sources before start that the 'copy' sources in
+        glyphsources copy from, directly or through other copies."""
+        refs = [g.src for g in glyphsources if isinstance(g, GlyphSourceGlyph)]
+        context = []
+        for glyphsrc in reversed(self.glyphsources[:start]):
+            if any(glyphsrc.matches(ref) for ref in refs):
+                context.insert(0, glyphsrc)
+                if isinstance(glyphsrc, GlyphSourceGlyph):
+                    refs.append(glyphsrc.src)
+        return context
+
+    def toBitmapFont(self, start=0, stop=None, progress=None):
+        """Makes the glyphs of the glyph sources in [start, stop) and applies
+        the effects to them.  progress is a BuildProgress."""
+        glyphsources = self.glyphsources[start:stop]
+        context = self._getCopyContext(start, glyphsources)
+        # the targets of effects may well be in another shard
+        sharded = len(glyphsources) != len(self.glyphsources)
+
         bitmapfont = BitmapFont(fontinfo=self.fontinfo, outlineCfg=self.outlineCfg,
                                 generateBitmap=self.generateBitmap, glyphs=[])
-        for glyphsrc in self.glyphsources:
+        glyphsources = context + glyphsources
+        self.prefetchImages(glyphsources)
+        if progress is not None:
+            glyphsources = progress.iterate("glyphs", glyphsources)
+        for glyphsrc in glyphsources:
             bitmapfont.appendGlyph(glyphsrc.toGlyph(bitmapfont))
 
-        for gopts, effname, effarg in self.effects:
-            for gopt in gopts:
-                if "codepoint" in gopt:
-                    codepoint = gopt["codepoint"]
-                    vs = gopt.get("vs", -1)
-                    glyphs = [bitmapfont.getGlyphByCodepoint(codepoint, vs)]
-                    if glyphs[0] is None:
-                        log.warn(
-                            "glyph to apply effect '{}' (U+{:04x}) was not found.".format(effname, codepoint))
-                        continue
-                elif "name" in gopt:
-                    name = gopt["name"]
-                    glyphs = [bitmapfont.getGlyphByName(name)]
-                    if glyphs[0] is None:
-                        log.warn("glyph to apply effect '{}' (name='{}') was not found.".format(
-                            effname, name))
-                        continue
-                elif "all_glyphs" in gopt:
-                    glyphs = bitmapfont.glyphs
-                for glyph in glyphs:
-                    getattr(glyph.bitmap, effname)(effarg)
+        _applyEffects(bitmapfont, self.effects, sharded, progress)
+
+        if context:
+            contextGlyphs = set(id(glyphsrc.toGlyph(bitmapfont))
+                                for glyphsrc in context)
+            bitmapfont.glyphs = [g for g in bitmapfont.glyphs
+                                 if id(g) not in contextGlyphs]
 
         return bitmapfont
 
@@ -402,10 +814,89 @@ class Config(object):
             # if dotShape == "pixel-outline":
             shape = DotShapePixelOutline()
         else:
-            shape = DotShapeExternal(dotShape["src"], dotShape["scale"])
+            shape = DotShapeExternal(
+                dotShape["src"], dotShape["scale"], dotShape["maxRun"],
+                dotShape["merge"])
+            if shape.merge:
+                if not shape.tiles:
+                    raise ConfigFileError(
+                        "dotShape: the shape does not tile, so touching dots cannot be merged")
+                if shape.neighbors is not None:
+                    raise ConfigFileError(
+                        "dotShape: the shape has variants for the neighbors, so touching dots cannot be merged")
+                dw, dh = self.outlineCfg["dotSize"]
+                rx, ry = shape.getCornerRadius(dw, dh)
+                if not (0 <= rx <= dw / 2 and 0 <= ry <= dh / 2):
+                    raise ConfigFileError(
+                        "dotShape: the corner radius must be up to half the dot")
 
         return shape
 
+    def check(self):
+        """Returns the problems found in the config without making the
+        glyphs: dot shapes that cannot be used, "copy" sources and effect
+        targets that refer to no glyph, and image cells outside their
+        image."""
+        problems = []
+        for cfg in self.getVariants():
+            try:
+                cfg.shape()
+            except (ConfigFileError, IOError, ValueError) as e:
+                problems.append("{}: dotShape: {}".format(cfg.outputTo, e))
+
+        for i, glyphsrc in enumerate(self.glyphsources):
+            if isinstance(glyphsrc, GlyphSourceGlyph):
+                # copies are made from the glyphs before them
+                if not any(g.matches(glyphsrc.src)
+                           for g in self.glyphsources[:i]):
+                    problems.append(
+                        "glyph '{}': the glyph to copy ({}) is not defined before it".format(
+                            glyphsrc.name, _describeRef(glyphsrc.src)))
+
+        effects = list(self.effects)
+        for variant in self.variants:
+            effects.extend(variant["effects"])
+        for targets, effname, effarg, excluded in effects:
+            for target in targets:
+                if "all_glyphs" in target:
+                    continue
+                if not any(_targetMatches(g, target)
+                           for g in self.glyphsources):
+                    problems.append(
+                        "effect '{}': the target glyph ({}) is not defined".format(
+                            effname, _describeTarget(target)))
+
+        sizes = {}
+        for glyphsrc in self.glyphsources:
+            if not isinstance(glyphsrc, GlyphSourceImage):
+                continue
+            key = glyphsrc.src if isinstance(glyphsrc.src, basestring) \
+                else id(glyphsrc.src)
+            if key not in sizes:
+                try:
+                    sizes[key] = getImageSize(glyphsrc.src)
+                except (IOError, ValueError, NetpbmError) as e:
+                    problems.append("image '{}': {}".format(key, e))
+                    sizes[key] = None
+            if sizes[key] is None:
+                continue
+            width, height = sizes[key]
+            x, y = glyphsrc.pos
+            w, h = glyphsrc.bitmapSize
+            if x < 0 or y < 0 or x + w > width or y + h > height:
+                problems.append(
+                    "glyph '{}': the cell ({}, {}, {}x{}) is outside the image ({}x{})".format(
+                        glyphsrc.name, x, y, w, h, width, height))
+        return problems
+
+
+def _describeRef(ref):
+    if "name" in ref:
+        return "name='{}'".format(ref["name"])
+    if ref.get("vs", -1) != -1:
+        return "U+{:04X} U+{:04X}".format(ref["codepoint"], ref["vs"])
+    return "U+{:04X}".format(ref["codepoint"])
+
 
 _UNIXXXX_REGEXP = re.compile(r"^u(?:ni)?([0-9A-Fa-f]{4,})$")
 _UNIXXXX_VS_REGEXP = re.compile(r"^u(?:ni)?([0-9A-Fa-f]{4,})\.u(?:ni)?(0*[Ff][Ee]0[0-9A-Fa-f]|0*[Ee]01[0-9A-Ea-e][0-9A-Fa-f])$")
@@ -444,6 +935,18 @@ class GlyphSource(object):
         self.vs = vs
 
         self.effects = []
+        # paths of the files the glyph is read from
+        self.files = []
+
+    # whether the glyph source object must specify name or codepoint
+    slotsRequired = True
+
+    def matches(self, ref):
+        """Returns whether ref ({"name": ...} or {"codepoint": ..., "vs":
+        ...}) refers to this glyph."""
+        if "name" in ref:
+            return self.name == ref["name"]
+        return self.codepoint == ref["codepoint"] and self.vs == ref.get("vs", -1)
 
     _glyph = None
 
@@ -488,8 +991,61 @@ class GlyphSourceBitmap(GlyphSource):
             for row in data]
 
     @classmethod
-    def parse_config(cls, obj, slots, opts, basepath=""):
-        return [cls(cls.data2bitmap(obj, opts), slot=slot, opts=opts) for slot in slots]
+    def packed2bytes(cls, obj, basepath="", resources=None):
+        """Returns the raw bytes of a packed 'data' object."""
+        if "hex" in obj:
+            data = obj["hex"]
+            if not isinstance(data, basestring):
+                data = "".join(data)
+            try:
+                return bytearray(binascii.unhexlify("".join(data.split())))
+            except (binascii.Error, TypeError, ValueError):
+                raise ConfigFileError("invalid hex glyph data")
+        if "base64" in obj:
+            try:
+                return bytearray(base64.b64decode(obj["base64"]))
+            except (binascii.Error, TypeError, ValueError):
+                raise ConfigFileError("invalid base64 glyph data")
+        if "file" in obj:
+            data = _resolve(obj["file"], basepath, resources)
+            if isinstance(data, basestring):
+                return getBinary(data)
+            return bytearray(data)
+        raise ConfigFileError(
+            "hex, base64 or file property is required in a packed 'data' object")
+
+    @classmethod
+    def parse_config(cls, obj, slots, opts, basepath="", resources=None):
+        if not isinstance(obj, dict):
+            return [cls(cls.data2bitmap(obj, opts), slot=slot, opts=opts) for slot in slots]
+
+        # Packed rows: each row is MSB-first and padded to a byte boundary,
+        # rows go from top to bottom and glyphs follow each other.  If the
+        # data holds only one glyph, it is shared by all the slots.
+        bitmapwidth, bitmapheight = getItem(opts, "bitmapSize")
+        data = cls.packed2bytes(obj, basepath, resources)
+        glyphsize = (bitmapwidth + 7) // 8 * bitmapheight
+        if "file" in obj:
+            offset = obj.get("offset", 0)
+            if offset + glyphsize * len(slots) > len(data):
+                raise ConfigFileError(
+                    "glyph data file '{}' is too short".format(obj["file"]))
+            offsets = [offset + glyphsize * i for i in range(len(slots))]
+        elif len(data) == glyphsize:
+            offsets = [0] * len(slots)
+        elif len(data) == glyphsize * len(slots):
+            offsets = [glyphsize * i for i in range(len(slots))]
+        else:
+            raise ConfigFileError(
+                "packed glyph data has {} bytes for {} glyphs of {} bytes".format(len(data), len(slots), glyphsize))
+        glyphs = [cls(unpackBitmap(data, bitmapwidth, bitmapheight, offset), slot=slot, opts=opts)
+                  for slot, offset in zip(slots, offsets)]
+        if "file" in obj:
+            src = _resolve(obj["file"], basepath, resources)
+            if isinstance(src, basestring):
+                for glyph in glyphs:
+                    glyph.files = [src]
+        return glyphs
 
 
 class GlyphSourceSpace(GlyphSourceBitmap):
@@ -498,7 +1054,7 @@ class GlyphSourceSpace(GlyphSourceBitmap):
         super(GlyphSourceSpace, self).__init__([[False]], slot, opts)
 
     @classmethod
-    def parse_config(cls, obj, slots, opts, basepath=""):
+    def parse_config(cls, obj, slots, opts, basepath="", resources=None):
         return [cls(slot=slot, opts=opts) for slot in slots]
 
 
@@ -507,14 +1063,13 @@ class GlyphSourceImage(GlyphSource):
         super(GlyphSourceImage, self).__init__(slot, opts)
         self.src = src
         self.pos = pos
+        if isinstance(src, basestring):
+            self.files = [src]
 
     def _toGlyph(self, font):
         w, h = self.bitmapSize
         x, y = self.pos
-        img = getImage(self.src)
-        imagedata = list(img.crop((x, y, x + w, y + h)).getdata())
-        bitmap = [[v == 0 for v in imagedata[i:i + w]]
-                  for i in range(0, w * h, w)]
+        bitmap = getImageBitmap(self.src, x, y, w, h)
         bitmap.reverse()
         return BitmapGlyph(
             self.codepoint, self.vs, self.name,
@@ -524,21 +1079,20 @@ class GlyphSourceImage(GlyphSource):
             voriginy=self.voriginy)
 
     @classmethod
-    def parse_config(cls, obj, slots, opts, basepath):
+    def parse_config(cls, obj, slots, opts, basepath, resources=None):
         x, y = getItem(obj, "pos")
-        src = getItem(obj, "src")
+        src = _resolve(getItem(obj, "src"), basepath, resources)
         glyphs = []
         x0 = x
         assert len(slots) > 0
         if len(slots) == 1:
-            return [cls(os.path.join(basepath, src), [x, y], slot=slots[0], opts=opts)]
+            return [cls(src, [x, y], slot=slots[0], opts=opts)]
 
         dx, dy = getItem(obj, "step")
         charsperrow = getItem(obj, "charsPerRow")
 
         for i, slot in enumerate(slots):
-            glyphs.append(cls(os.path.join(basepath, src),
-                              [x, y], slot=slot, opts=opts))
+            glyphs.append(cls(src, [x, y], slot=slot, opts=opts))
             if (i + 1) % charsperrow == 0:
                 x = x0
                 y += dy
@@ -566,7 +1120,7 @@ class GlyphSourceGlyph(GlyphSource):
             voriginy=self.voriginy)
 
     @classmethod
-    def parse_config(cls, obj, slots, opts, basepath=""):
+    def parse_config(cls, obj, slots, opts, basepath="", resources=None):
         if "fromChar" in obj:
             chrs = _str2slots(obj["fromChar"])
             if len(chrs) != 1:
@@ -585,6 +1139,100 @@ class GlyphSourceGlyph(GlyphSource):
         return [cls(src, slot=slot, opts=opts) for slot in slots]
 
 
+class GlyphSourceFontFile(GlyphSource):
+    def __init__(self, glyph, slot, opts):
+        opts = dict(opts)
+        opts["bitmapSize"] = [glyph.width, glyph.height]
+        opts["origin"] = [-glyph.xoff, -glyph.yoff]
+        opts["advancewidth"] = glyph.dwidth
+        super(GlyphSourceFontFile, self).__init__(slot, opts)
+        self.data = glyph.data
+
+    def _toGlyph(self, font):
+        w, h = self.bitmapSize
+        bitmap = unpackBitmap(self.data, w, h)
+        bitmap.reverse()
+        return BitmapGlyph(
+            self.codepoint, self.vs, self.name,
+            bitmap,
+            origin=self.origin,
+            advance=(self.advancewidth, self.advanceheight),
+            voriginy=self.voriginy)
+
+    # all the glyphs in the file are used if no name or codepoint is given
+    slotsRequired = False
+
+    @classmethod
+    def parse_config(cls, obj, slots, opts, basepath="", resources=None):
+        path = getItem(obj, "src")
+        src = _resolve(path, basepath, resources)
+        files = [src] if isinstance(src, basestring) else []
+        try:
+            fontfile = openFontFile(src)
+        except (IOError, FontFileError) as e:
+            raise ConfigFileError(
+                "cannot read font file '{}': {}".format(path, e))
+
+        registry = fontfile.properties.get("CHARSET_REGISTRY", "ISO10646")
+        if registry.upper() != "ISO10646":
+            log.warn("encodings in '{}' ({}) are used as Unicode codepoints".format(
+                path, registry))
+
+        opts = dict(opts)
+        ascent = fontfile.properties.get("FONT_ASCENT", 0)
+        descent = fontfile.properties.get("FONT_DESCENT", 0)
+        opts.setdefault("advanceheight", ascent + descent)
+        opts.setdefault("voriginy", ascent)
+        glyphNames = obj.get("glyphNames", False)
+
+        if slots is None:
+            glyphs = []
+            try:
+                for glyph in fontfile:
+                    slot = {}
+                    if glyph.encoding >= 0:
+                        slot["codepoint"] = glyph.encoding
+                    if glyphNames or glyph.encoding < 0:
+                        slot["name"] = glyph.name
+                    glyphs.append(cls(glyph, slot=slot, opts=opts))
+            except FontFileError as e:
+                raise ConfigFileError(
+                    "cannot read font file '{}': {}".format(path, e))
+            for glyph in glyphs:
+                glyph.files = files
+            return glyphs
+
+        byCodepoint = {}
+        byName = {}
+        for i, slot in enumerate(slots):
+            if "codepoint" in slot:
+                byCodepoint.setdefault(slot["codepoint"], []).append(i)
+            else:
+                byName.setdefault(slot["name"], []).append(i)
+        found = [None] * len(slots)
+        try:
+            for glyph in fontfile:
+                indices = byCodepoint.get(glyph.encoding, []) + \
+                    byName.get(glyph.name, [])
+                for i in indices:
+                    if found[i] is None:
+                        found[i] = glyph
+        except FontFileError as e:
+            raise ConfigFileError(
+                "cannot read font file '{}': {}".format(path, e))
+
+        glyphs = []
+        for slot, glyph in zip(slots, found):
+            if glyph is None:
+                log.warn("glyph {} was not found in '{}'.".format(
+                    slot, path))
+                continue
+            glyphs.append(cls(glyph, slot=slot, opts=opts))
+        for glyph in glyphs:
+            glyph.files = files
+        return glyphs
+
+
 def memoize(f):
     cache = {}
 
@@ -598,6 +1246,180 @@ def memoize(f):
     return _f
 
 
-@memoize
+_fileCaches = []
+
+
+def _statKey(path):
+    st = os.stat(path)
+    return (st.st_mtime, st.st_size)
+
+
+def memoizeFile(f):
+    """Like memoize, for functions of a file path.  The cached values can be
+    dropped by invalidateFileCaches when the file changes."""
+    cache = {}
+    _fileCaches.append(cache)
+
+    def _f(path):
+        if path in cache:
+            return cache[path][1]
+        key = _statKey(path)
+        v = f(path)
+        cache[path] = (key, v)
+        return v
+
+    return _f
+
+
+def invalidateFileCaches():
+    """Drops the cached values of the files modified since they were read.
+    Returns the paths of those files."""
+    paths = []
+    for cache in _fileCaches:
+        for path, (key, v) in list(cache.items()):
+            try:
+                changed = _statKey(path) != key
+            except OSError:
+                changed = True
+            if changed:
+                del cache[path]
+                paths.append(path)
+    return paths
+
+
+@memoizeFile
 def getImage(path):
-    return Image.open(path).convert("L")
+    if isNetpbm(path):
+        return NetpbmImage(path)
+    from PIL import Image
+
+    return prepareImage(Image.open(path))
+
+
+def prepareImage(img):
+    if img.mode == "1":
+        # black is 0 in mode "1" too; no need to convert
+        return img
+    return img.convert("L")
+
+
+def loadImage(path):
+    img = getImage(path)
+    if not isinstance(img, NetpbmImage):
+        # Image.open is lazy
+        img.load()
+
+
+def getImageSize(src):
+    """Returns the size (width, height) of an image (a path or an image
+    object), reading only the header of an image file."""
+    if not isinstance(src, basestring):
+        img = src
+    elif isNetpbm(src):
+        img = getImage(src)
+    else:
+        from PIL import Image
+
+        img = Image.open(src)
+        try:
+            return img.size
+        finally:
+            img.close()
+    if isinstance(img, (NetpbmImage, Bitmap)):
+        return (img.width, img.height)
+    return img.size
+
+
+def getImageDecodedSize(path):
+    """Estimates the memory needed to decode an image, in bytes."""
+    from PIL import Image
+
+    if isNetpbm(path):
+        return 0  # memory-mapped
+    img = Image.open(path)
+    try:
+        w, h = img.size
+        # the decoded image and the one converted to "L"
+        return w * h * (len(img.getbands()) + 1)
+    finally:
+        img.close()
+
+
+def getImageBitmap(src, x, y, w, h):
+    """Returns the rows (top to bottom) of a cell in an image (a path, an
+    image object or a Bitmap), with True for black pixels."""
+    if isinstance(src, basestring):
+        img = getImage(src)
+    else:
+        img = src
+    if isinstance(img, NetpbmImage):
+        return img.getBitmap(x, y, w, h)
+    if isinstance(img, Bitmap):
+        # its rows go from the bottom; like Image.crop, pixels outside it
+        # are black
+        rows = []
+        for yy in range(y, y + h):
+            if not 0 <= yy < img.height:
+                rows.append([True] * w)
+                continue
+            row = img.bitmap[img.height - 1 - yy]
+            x0 = max(x, 0)
+            x1 = min(x + w, img.width)
+            cell = [True] * min(x0 - x, w)
+            if x0 < x1:
+                cell.extend(bool(b) for b in row[x0:x1])
+            cell.extend([True] * (w - len(cell)))
+            rows.append(cell)
+        return rows
+    imagedata = list(img.crop((x, y, x + w, y + h)).getdata())
+    return [[v == 0 for v in imagedata[i:i + w]]
+            for i in range(0, w * h, w)]
+
+
+@memoizeFile
+def getBinary(path):
+    with open(path, "rb") as f:
+        return bytearray(f.read())
+
+
+_byte2bits = [[bool(b >> (7 - i) & 1) for i in range(8)] for b in range(256)]
+
+
+def unpackBitmap(data, width, height, offset=0):
+    """Decodes packed rows (MSB-first, byte-aligned, top to bottom)."""
+    rowsize = (width + 7) // 8
+    bitmap = []
+    for y in range(height):
+        row = []
+        for b in data[offset:offset + rowsize]:
+            row.extend(_byte2bits[b])
+        del row[width:]
+        bitmap.append(row)
+        offset += rowsize
+    return bitmap
+
+
+def packBitmap(bitmap, width):
+    """Encodes rows of a bitmap (top to bottom) into packed rows."""
+    data = bytearray()
+    for row in bitmap:
+        row = list(row[:width]) + [False] * (width - len(row))
+        row += [False] * (-width % 8)
+        for i in range(0, len(row), 8):
+            byte = 0
+            for b in row[i:i + 8]:
+                byte = byte << 1 | bool(b)
+            data.append(byte)
+    return data
+
+
+def data2hex(data, bitmapSize):
+    """Converts a 'data' value in the string form into the hex form."""
+    bitmapwidth, bitmapheight = bitmapSize
+    bitmap = GlyphSourceBitmap.data2bitmap(data, {"bitmapSize": bitmapSize})
+    bitmap += [[]] * (bitmapheight - len(bitmap))
+    rowsize = (bitmapwidth + 7) // 8
+    packed = binascii.hexlify(packBitmap(bitmap[:bitmapheight], bitmapwidth))
+    packed = packed.decode("ascii").upper()
+    return {"hex": [packed[i:i + rowsize * 2]
+                    for i in range(0, len(packed), rowsize * 2)]}
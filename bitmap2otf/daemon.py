@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import base64
+import copy
+import io
+import json
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+
+try:
+    from http.server import BaseHTTPRequestHandler
+    from http.server import HTTPServer
+    from socketserver import ThreadingMixIn
+    from socketserver import UnixStreamServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer
+    from SocketServer import ThreadingMixIn
+    from SocketServer import UnixStreamServer
+
+from bitmap2otf import BuildCache
+from bitmap2otf import buildFont
+from bitmap2otf import compileVariants
+from bitmap2otf import saveCompiled
+from bitmap2otf import version
+from bitmap2otf import writeInputHashes
+from client import DEFAULT_PORT
+from config import Config
+from config import getItem
+from config import invalidateFileCaches
+
+log = logging.getLogger(__name__)
+
+
+_cache = None
+
+
+def _initWorker(maxGlyphs):
+    global _cache
+    _cache = BuildCache(maxGlyphs)
+
+
+def build(req):
+    """Runs a build request in a worker.
+
+    req is an object with:
+      config: path of the config file, or a config object
+      basepath: directory the paths in an inline config are relative to
+      output: where to save the font (default: as the config says)
+      return: "bytes" to get the font back (base64) instead of saving it
+
+    The reply has the saved "outputs" (the font of each outline variant and
+    its slices), or the "font" (without the slices).
+    """
+    start = time.time()
+    try:
+        invalidateFileCaches()
+        cfg = Config(getItem(req, "config", "build request"),
+                     basepath=req.get("basepath", ""))
+        if len(cfg.getVariants()) > 1 and (req.get("return") == "bytes" or req.get("output")):
+            raise ValueError("the config has several variants")
+        f = cfg.toBitmapFont()
+
+        outputs = []
+        for vcfg, compiled in compileVariants(cfg, f, _cache):
+            if req.get("return") == "bytes":
+                otf = buildFont(vcfg, compiled,
+                                otf=_cache.getTemplateFont(vcfg.templates))
+                buf = io.BytesIO()
+                otf.save(buf)
+                return {
+                    "font": base64.b64encode(buf.getvalue()).decode("ascii"),
+                    "time": time.time() - start,
+                }
+            output = req.get("output") or vcfg.outputTo
+            if output is None:
+                raise ValueError("no output path")
+            vcfg = copy.copy(vcfg)
+            vcfg.outputTo = output
+            # workers cannot fork the processes that build slices in parallel
+            saved = saveCompiled(vcfg, compiled, _cache, parallel=False)
+            writeInputHashes(saved)
+            outputs.extend(saved)
+        return {"outputs": outputs, "time": time.time() - start}
+    except Exception as e:
+        log.debug(traceback.format_exc())
+        return {"error": "{}: {}".format(type(e).__name__, e)}
+
+
+class BuildRequestHandler(BaseHTTPRequestHandler):
+    server_version = "Bitmap2OTF/" + version
+
+    def do_POST(self):
+        if self.path != "/build":
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            req = json.loads(self.rfile.read(length).decode("utf-8"))
+        except ValueError:
+            self.send_error(400)
+            return
+        res = self.server.pool.apply(build, (req, ))
+        body = json.dumps(res).encode("utf-8")
+        self.send_response(500 if "error" in res else 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # client_address is empty on Unix domain sockets
+        return str(self.client_address[0]) if self.client_address else "-"
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(socketpath=None, port=DEFAULT_PORT, workers=None, maxGlyphs=500000):
+    """Serves build requests until interrupted.  Requests are queued onto a
+    pool of worker processes, each keeping its own caches."""
+    if socketpath is not None:
+        if os.path.exists(socketpath):
+            os.remove(socketpath)
+        server = ThreadingUnixHTTPServer(socketpath, BuildRequestHandler)
+    else:
+        server = ThreadingHTTPServer(("127.0.0.1", port), BuildRequestHandler)
+    server.pool = multiprocessing.Pool(
+        workers, initializer=_initWorker, initargs=(maxGlyphs, ))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.pool.terminate()
+        server.pool.join()
+        if socketpath is not None and os.path.exists(socketpath):
+            os.remove(socketpath)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Bitmap2OTF {} build daemon. Use client.py to send builds.".format(version))
+    parser.add_argument("--socket", metavar="PATH",
+                        help="listen on a Unix domain socket instead of localhost")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="port to listen on localhost (default: %(default)s)")
+    parser.add_argument("--workers", type=int,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--max-glyphs", type=int, default=500000,
+                        help="compiled glyphs to keep per worker (default: %(default)s)")
+    args = parser.parse_args()
+    logging.basicConfig()
+    serve(args.socket, args.port, args.workers, args.max_glyphs)
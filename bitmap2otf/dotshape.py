@@ -6,6 +6,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import json
+import math
 import re
 
 
@@ -24,6 +25,71 @@ def _vec2string(x, y, suf=""):
     return "{} {} r{}".format(_intorfloat(x), _intorfloat(y), suf)
 
 
+def _numberSize(v):
+    """Returns the size in bytes of the number in a Type 2 charstring."""
+    if v != int(v):
+        return 5
+    v = int(v)
+    if -107 <= v <= 107:
+        return 1
+    if -1131 <= v <= 1131:
+        return 2
+    if -32768 <= v <= 32767:
+        return 3
+    return 5
+
+
+def _charstringSize(program):
+    """Returns the size in bytes of a Type 2 charstring program."""
+    return sum(1 if token[-1].isalpha() else _numberSize(float(token))
+               for token in program.split())
+
+
+def _movetoSize(x, y):
+    # as written by _vec2string
+    if x == 0:
+        return _numberSize(y) + 1
+    if y == 0:
+        return _numberSize(x) + 1
+    return _numberSize(x) + _numberSize(y) + 1
+
+
+def _round(v):
+    return int(math.floor(v + 0.5))
+
+
+def _contoursBounds(contours):
+    xs = [x for contour in contours for x, y, onCurve in contour]
+    ys = [y for contour in contours for x, y, onCurve in contour]
+    if not xs:
+        return None
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+def _charstringContours(program, maxErr=1.0):
+    """Returns the contours of a charstring program (without endchar) as
+    lists of (x, y, onCurve) for a glyf table: the curves are converted to
+    quadratic ones, and the contours reversed to go clockwise."""
+    from fontTools.cffLib import PrivateDict
+    from fontTools.misc.psCharStrings import T2CharString
+    from fontTools.pens.cu2quPen import Cu2QuPen
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+
+    charstring = T2CharString(private=PrivateDict())
+    charstring.fromXML("CharString", {}, program + " endchar")
+    pen = TTGlyphPen(None)
+    charstring.draw(Cu2QuPen(pen, maxErr, reverse_direction=True))
+    glyph = pen.glyph()
+    contours = []
+    start = 0
+    for end in getattr(glyph, "endPtsOfContours", []):
+        contours.append([
+            (int(x), int(y), bool(flag & 1)) for (x, y), flag in
+            zip(glyph.coordinates[start:end + 1], glyph.flags[start:end + 1])])
+        start = end + 1
+    return contours
+
+
 def _evalxy(xystr, x=1.0, y=1.0):
     if xystr[-1] == "x":
         return float(xystr[:-1]) * x
@@ -32,6 +98,18 @@ def _evalxy(xystr, x=1.0, y=1.0):
     return float(xystr)
 
 
+def getSubroutineNumbers(subrs):
+    subrl = len(subrs)
+    if subrl < 1240:
+        bias = 107
+    elif subrl < 33900:
+        bias = 1131
+    else:
+        bias = 32768
+
+    return range(-bias, subrl - bias)
+
+
 class DotShape(object):
     def getGlyphBBX(self, bitmap, dw=100.0, dh=100.0):
         bBBX = bitmap.getBoundingBox()
@@ -43,6 +121,40 @@ class DotShape(object):
             bBBX[3] * dh + dBBX[3]
         ]
 
+    def getContoursBBX(self, contours, components, dw=100.0, dh=100.0):
+        """Returns the bounding box of the outline made by bitmap2contours,
+        as the glyf table has it (off-curve points included)."""
+        bounds = [b for b in [_contoursBounds(contours)] if b is not None]
+        for variant in sorted(set(c[2] for c in components)):
+            dot = _contoursBounds(self.getDotContours(dw, dh, variant))
+            if dot is not None:
+                xs = [x for x, y, v in components if v == variant]
+                ys = [y for x, y, v in components if v == variant]
+                bounds.append([min(xs) + dot[0], min(ys) + dot[1],
+                               max(xs) + dot[2], max(ys) + dot[3]])
+        if not bounds:
+            return [0, 0, 0, 0]
+        return [min(b[0] for b in bounds), min(b[1] for b in bounds),
+                max(b[2] for b in bounds), max(b[3] for b in bounds)]
+
+
+# size in pixels of the cells that DotShapePixelOutline looks for the next
+# polygon to draw in
+_ORDER_CELL = 2
+
+
+def _ring(cx, cy, r):
+    """Yields the cells at Chebyshev distance r from (cx, cy)."""
+    if r == 0:
+        yield (cx, cy)
+        return
+    for i in range(-r, r + 1):
+        yield (cx + i, cy - r)
+        yield (cx + i, cy + r)
+    for i in range(-r + 1, r):
+        yield (cx - r, cy + i)
+        yield (cx + r, cy + i)
+
 
 class DotShapePixelOutline(DotShape):
     def bitmap2charstring(self, bitmap, dw=100.0, dh=100.0, subrs=[]):
@@ -52,7 +164,7 @@ class DotShapePixelOutline(DotShape):
 
         buf = ""
         x = y = 0.0
-        for polygon in polygons:
+        for polygon in self._order(polygons, dw, dh):
             x1, y1 = polygon[0]
             buf += _vec2string((x1 - x) * dw, (y1 - y) * dh, "moveto ")
             x, y = x1, y1
@@ -88,9 +200,75 @@ class DotShapePixelOutline(DotShape):
 
         return buf.strip()
 
+    def _getStart(self, polygon, x, y, dw, dh):
+        """Returns (size, i): the vertex i to start the polygon at to take
+        the fewest bytes, counting the moveto to it from (x, y) and the edge
+        into it, which is left to the implicit closepath."""
+        best = None
+        for i, (x1, y1) in enumerate(polygon):
+            x0, y0 = polygon[i - 1]
+            if y0 == y1:
+                closing = (x1 - x0) * dw
+            else:
+                closing = (y1 - y0) * dh
+            size = _movetoSize((x1 - x) * dw, (y1 - y) * dh) - \
+                _numberSize(closing)
+            if best is None or size < best[0]:
+                best = (size, i)
+        return best
+
+    def _order(self, polygons, dw, dh):
+        """Yields the polygons rotated to their best start, drawing next the
+        one that takes the fewest bytes to move to (greedily).  Only the
+        polygons with a vertex in the cells around the current point are
+        tried, so that glyphs of many small polygons stay fast."""
+        cells = {}
+        for j, polygon in enumerate(polygons):
+            for x1, y1 in polygon:
+                cells.setdefault((x1 // _ORDER_CELL, y1 // _ORDER_CELL), set()).add(j)
+        x = y = 0
+        rest = len(polygons)
+        while rest:
+            # the first ring of cells with a polygon in it, and the next
+            # one, as a vertex in it may still be closer
+            cx, cy = x // _ORDER_CELL, y // _ORDER_CELL
+            candidates = set()
+            r = 0
+            while not candidates:
+                for key in _ring(cx, cy, r):
+                    candidates.update(cells.get(key, ()))
+                r += 1
+            for key in _ring(cx, cy, r):
+                candidates.update(cells.get(key, ()))
+            best = None
+            for j in sorted(candidates):
+                size, i = self._getStart(polygons[j], x, y, dw, dh)
+                if best is None or size < best[0]:
+                    best = (size, j, i)
+            size, j, i = best
+            polygon = polygons[j]
+            for x1, y1 in polygon:
+                cells[(x1 // _ORDER_CELL, y1 // _ORDER_CELL)].discard(j)
+            rest -= 1
+            polygon = polygon[i:] + polygon[:i]
+            x, y = polygon[-1]
+            yield polygon
+
+    def bitmap2contours(self, bitmap, dw=100.0, dh=100.0):
+        """Returns (contours, components) of the bitmap for a glyf table:
+        the contours as lists of (x, y, onCurve), and the components that
+        draw a dot as (x, y, variant) (none here)."""
+        # the polygons go counterclockwise as in CFF
+        return [[(_round(x * dw), _round(y * dh), True)
+                 for x, y in reversed(polygon)]
+                for polygon in bitmap.toPolygons()], []
+
     def getSubroutines(self, dw=100.0, dh=100.0):
         return []
 
+    def getKey(self):
+        return ("pixel-outline", )
+
     def getDotBBX(self, dw=100.0, dh=100.0):
         return [0.0, 0.0, dw, dh]
 
@@ -98,8 +276,61 @@ class DotShapePixelOutline(DotShape):
 _FACTOR_XORY_RE = re.compile(r"^[+-]?[\d.]+(?:e[+-]?\d+)?[xy]$")
 
 
+# Runs up to this length repeat the dot in the subroutine; longer ones call
+# the subroutine of the half run twice, which keeps them small.
+_MAX_INLINE_RUN = 8
+# upper limit of the length of an inline run subroutine in the text form, to
+# keep the compiled one well within the 64K limit of a charstring
+_MAX_RUN_SUBR_LENGTH = 32768
+
+
+# control point distance of a quarter ellipse, relative to its radius
+_KAPPA = 0.5522847498
+
+# the neighbors of a dot that pick its variant, in the order of the bits of
+# the neighborhood mask: the 4-neighborhood is the first four
+_NEIGHBORS = [("N", 0, 1), ("E", 1, 0), ("S", 0, -1), ("W", -1, 0),
+              ("NE", 1, 1), ("SE", 1, -1), ("SW", -1, -1), ("NW", -1, 1)]
+
+
+def _neighborMask(directions, neighbors, where):
+    mask = 0
+    for direction in directions:
+        for i, (name, dx, dy) in enumerate(_NEIGHBORS[:neighbors]):
+            if direction == name:
+                mask |= 1 << i
+                break
+        else:
+            raise ValueError(
+                "{}: '{}' is not a direction of the {}-neighborhood".format(
+                    where, direction, neighbors))
+    return mask
+
+
 class DotShapeExternal(DotShape):
-    def __init__(self, obj, scale=(1.0, 1.0)):
+    """Shape drawn by a subroutine for each dot.
+
+    Besides the subroutine of a single dot, there are subroutines that draw
+    horizontal runs of 2, 4, 8, ... (up to maxRun, if it is over 1) dots, so
+    that a row of dots is drawn with a few calls.  They start and end like
+    the dot.  They are not made by default, as they pay for themselves
+    only in fonts with many long rows.
+
+    A shape that declares it tiles (fills its cell, like a square) can merge
+    the touching dots instead: each group of them is drawn as the outline of
+    the union, with the convex corners rounded by the shape's radiusX and
+    radiusY.  Without rounded corners the union looks the same as the dots,
+    so a glyph is drawn dot by dot when that is shorter.
+
+    A shape may also have variants of the dot that depend on the dots
+    around it ("neighbors": 4 or 8).  Each variant is drawn by a subroutine
+    of its own, and is chosen for the dots that have the neighbors "with"
+    it and none "without" it (the first that matches, or the dot itself);
+    the choice for each neighborhood mask is made once, in a table.  The
+    runs are drawn only of dots that take no variant.
+    """
+
+    def __init__(self, obj, scale=(1.0, 1.0), maxRun=1, merge=False):
         if isinstance(obj, dict):
             shape = obj
         else:
@@ -122,52 +353,305 @@ class DotShapeExternal(DotShape):
             shape.get("maxX", "1x"),
             shape.get("maxY", "1y")
         ]
+        self.maxRun = maxRun
+        self.tiles = bool(shape.get("tiles", False))
+        self.radiusX = shape.get("radiusX", "0x")
+        self.radiusY = shape.get("radiusY", "0y")
+        self.merge = merge
+        self._runLengths = {}
+        self._dotContours = {}
+
+        # the dot itself and its variants
+        self.variants = [(self.startX, self.startY, self.endX, self.endY,
+                          self.charstring, tuple(self.bbx))]
+        self.neighbors = shape.get("neighbors")
+        self._variantTable = None
+        if self.neighbors is not None:
+            if self.neighbors not in (4, 8):
+                raise ValueError("neighbors must be 4 or 8")
+            masks = []
+            for i, variant in enumerate(shape.get("variants", []), 1):
+                where = "variant {}".format(i)
+                vStartX = variant.get("startX", startX)
+                vStartY = variant.get("startY", startY)
+                self.variants.append((
+                    vStartX, vStartY,
+                    variant.get("endX", vStartX), variant.get("endY", vStartY),
+                    variant["data"],
+                    tuple(variant.get(key, default) for key, default in zip(
+                        ["minX", "minY", "maxX", "maxY"], self.bbx))))
+                masks.append((
+                    _neighborMask(variant.get("with", []), self.neighbors, where),
+                    _neighborMask(variant.get("without", []), self.neighbors, where)))
+
+            # the variant of each neighborhood mask
+            self._variantTable = []
+            for mask in range(1 << self.neighbors):
+                for i, (withMask, withoutMask) in enumerate(masks, 1):
+                    if mask & withMask == withMask and not mask & withoutMask:
+                        self._variantTable.append(i)
+                        break
+                else:
+                    self._variantTable.append(0)
+
+    def _getStartEnd(self, dw, dh, variant=0):
+        sw = self.sx * dw
+        sh = self.sy * dh
+        return tuple(_evalxy(v, x=sw, y=sh)
+                     for v in self.variants[variant][:4])
+
+    def _getRunLengths(self, dw, dh):
+        if (dw, dh) not in self._runLengths:
+            runLengths = [1]
+            while runLengths[-1] * 2 <= self.maxRun:
+                runLengths.append(runLengths[-1] * 2)
+            self._runLengths[(dw, dh)] = runLengths
+        return self._runLengths[(dw, dh)]
+
+    def _getDotVariants(self, bitmap):
+        """Returns the list of (x, y, variant) of the dots of the bitmap."""
+        dots = bitmap.getDots()
+        if self._variantTable is None:
+            return [(x, y, 0) for x, y in dots]
+        dotSet = set(dots)
+        offsets = [(1 << i, dx, dy)
+                   for i, (name, dx, dy) in enumerate(_NEIGHBORS[:self.neighbors])]
+        table = self._variantTable
+        res = []
+        for x, y in dots:
+            mask = 0
+            for bit, dx, dy in offsets:
+                if (x + dx, y + dy) in dotSet:
+                    mask |= bit
+            res.append((x, y, table[mask]))
+        return res
+
+    def _getRuns(self, dots):
+        # horizontal runs of the dots that take no variant, to be split into
+        # pieces of the lengths of the run subroutines
+        runs = []
+        for x, y, variant in dots:
+            if not variant and runs and not runs[-1][3] and \
+                    runs[-1][1] == y and runs[-1][0] + runs[-1][2] == x:
+                runs[-1][2] += 1
+            else:
+                runs.append([x, y, 1, variant])
+        return runs
+
+    def _mergeLooksSame(self, dw, dh):
+        # without rounded corners, the merged outline is the union of the
+        # dots, which look the same drawn one by one
+        rx, ry = self.getCornerRadius(dw, dh)
+        return rx == 0 or ry == 0
 
     def bitmap2charstring(self, bitmap, dw=100.0, dh=100.0, subrs=[]):
-        dots = list(bitmap.dotiter())
+        if self.merge:
+            merged = self._mergedCharstring(bitmap, dw, dh)
+            if not self._mergeLooksSame(dw, dh):
+                return merged
+            # the dots drawn one by one may be shorter
+            dots = self._dotsCharstring(bitmap, dw, dh, subrs)
+            if _charstringSize(dots) < _charstringSize(merged):
+                return dots
+            return merged
+        return self._dotsCharstring(bitmap, dw, dh, subrs)
+
+    def _dotsCharstring(self, bitmap, dw, dh, subrs):
+        dots = self._getDotVariants(bitmap)
         if not dots:
             return ""
 
-        sx = self.sx
-        sy = self.sy
-        sw = sx * dw
-        sh = sy * dh
-        startX = _evalxy(self.startX, x=sw, y=sh)
-        startY = _evalxy(self.startY, x=sw, y=sh)
-        endX = _evalxy(self.endX, x=sw, y=sh)
-        endY = _evalxy(self.endY, x=sw, y=sh)
-
-        subrno = subrs[0]
-        e2sX = startX - endX
-        e2sY = startY - endY
+        startEnds = [self._getStartEnd(dw, dh, variant)
+                     for variant in range(len(self.variants))]
+        runLengths = self._getRunLengths(dw, dh)
 
         buf = ""
+        last = None
+        for x, y, length, variant in self._getRuns(dots):
+            startX, startY, endX, endY = startEnds[variant]
+            while length:
+                if variant:
+                    # the variant subroutines follow the run ones
+                    subr = subrs[len(runLengths) + variant - 1]
+                    n = 1
+                else:
+                    i = len(runLengths) - 1
+                    while runLengths[i] > length:
+                        i -= 1
+                    subr = subrs[i]
+                    n = runLengths[i]
+
+                if last is None:
+                    buf += _vec2string(x * dw + startX,
+                                       y * dh + startY, "moveto ")
+                else:
+                    buf += _vec2string((x - last[0]) * dw + (startX - last[2]),
+                                       (y - last[1]) * dh + (startY - last[3]),
+                                       "moveto ")
+                buf += "{} callsubr ".format(subr)
+
+                last = (x + n - 1, y, endX, endY)
+                x += n
+                length -= n
 
-        buf += _vec2string(dots[0][0] * dw + startX,
-                           dots[0][1] * dh + startY, "moveto ")
-        buf += "{} callsubr ".format(subrno)
+        return buf.strip()
 
-        for (x0, y0), (x1, y1) in zip(dots[:-1], dots[1:]):
-            buf += _vec2string((x1 - x0) * dw + e2sX,
-                               (y1 - y0) * dh + e2sY, "moveto ")
-            buf += "{} callsubr ".format(subrno)
+    def bitmap2contours(self, bitmap, dw=100.0, dh=100.0):
+        """Returns (contours, components) of the bitmap for a glyf table.
+        Each dot is a component, a reference to the glyph of the variant of
+        a dot (see getDotContours) at the returned position, unless touching
+        dots are merged into contours."""
+        if self.merge:
+            rx, ry = self.getCornerRadius(dw, dh)
+            if rx == 0 or ry == 0:
+                return _pixelOutline.bitmap2contours(bitmap, dw, dh)
+            return _charstringContours(
+                self._mergedCharstring(bitmap, dw, dh)), []
+        return [], [(_round(x * dw), _round(y * dh), variant)
+                    for x, y, variant in self._getDotVariants(bitmap)]
+
+    def getDotContours(self, dw=100.0, dh=100.0, variant=0):
+        """Returns the contours of the glyph of a dot (or of its variant)
+        for a glyf table."""
+        if (dw, dh, variant) not in self._dotContours:
+            startX, startY, endX, endY = self._getStartEnd(dw, dh, variant)
+            self._dotContours[(dw, dh, variant)] = _charstringContours(
+                _vec2string(startX, startY, "moveto ") +
+                self._getDotSubroutine(dw, dh, variant))
+        return self._dotContours[(dw, dh, variant)]
+
+    def getCornerRadius(self, dw=100.0, dh=100.0):
+        """Returns the radii of the rounded corners of merged dots."""
+        sw = self.sx * dw
+        sh = self.sy * dh
+        return (_evalxy(self.radiusX, x=sw, y=sh),
+                _evalxy(self.radiusY, x=sw, y=sh))
 
-        return buf.strip()
+    def _mergedCharstring(self, bitmap, dw, dh):
+        rx, ry = self.getCornerRadius(dw, dh)
+        if rx == 0 or ry == 0:
+            return _pixelOutline.bitmap2charstring(bitmap, dw, dh)
 
-    def getSubroutines(self, dw=100.0, dh=100.0):
+        buf = []
+        x = y = 0.0
+        for polygon in bitmap.toPolygons():
+            # the contours are counterclockwise around the dots, so the
+            # corners turning left are convex
+            n = len(polygon)
+            edges = []
+            for i in range(n):
+                (x0, y0), (x1, y1) = polygon[i], polygon[(i + 1) % n]
+                edges.append(((x1 - x0) * dw, (y1 - y0) * dh))
+            convex = [edges[i - 1][0] * edges[i][1] -
+                      edges[i - 1][1] * edges[i][0] > 0 for i in range(n)]
+
+            # start after the corner at the first vertex
+            x1 = polygon[0][0] * dw
+            y1 = polygon[0][1] * dh
+            if convex[0]:
+                x1 += math.copysign(rx, edges[0][0]) if edges[0][0] else 0.0
+                y1 += math.copysign(ry, edges[0][1]) if edges[0][1] else 0.0
+            buf.append(_vec2string(x1 - x, y1 - y, "moveto"))
+            x, y = x1, y1
+
+            for i, (ex, ey) in enumerate(edges):
+                j = (i + 1) % n
+                # the line, shortened by the rounded corners at its ends,
+                # except the last one that closepath draws
+                trim = (rx if ex else ry) * (convex[i] + convex[j])
+                length = math.copysign(abs(ex or ey) - trim, ex or ey)
+                if length and (j or convex[j]):
+                    buf.append("{} {}lineto".format(
+                        _intorfloat(length), "h" if ex else "v"))
+                    if ex:
+                        x += length
+                    else:
+                        y += length
+                if convex[j]:
+                    # quarter ellipse from this direction to the next one
+                    nx, ny = edges[j]
+                    cx = math.copysign(rx, ex or nx)
+                    cy = math.copysign(ry, ey or ny)
+                    if ex:
+                        a, b = round(cx * _KAPPA), round(cy * _KAPPA)
+                        args = (a, cx - a, cy - b, b, "hv")
+                    else:
+                        a, b = round(cy * _KAPPA), round(cx * _KAPPA)
+                        args = (a, cx - b, cy - a, b, "vh")
+                    buf.append("{} {} {} {} {}curveto".format(
+                        *[_intorfloat(v) for v in args[:4]] + [args[4]]))
+                    x += cx
+                    y += cy
+
+        return " ".join(buf)
+
+    def _getDotSubroutine(self, dw, dh, variant=0):
         sw = self.sx * dw
         sh = self.sy * dh
 
         buf = []
-        for token in self.charstring.split():
+        for token in self.variants[variant][4].split():
             if _FACTOR_XORY_RE.match(token):
                 buf.append(str(_evalxy(token, x=sw, y=sh)))
             else:
                 buf.append(token)
 
-        return [" ".join(buf)]
+        return " ".join(buf)
 
-    def getDotBBX(self, dw=100.0, dh=100.0):
+    def getSubroutines(self, dw=100.0, dh=100.0):
+        if self.merge and not self._mergeLooksSame(dw, dh):
+            return []
+
+        dot = self._getDotSubroutine(dw, dh)
+        startX, startY, endX, endY = self._getStartEnd(dw, dh)
+        step = _vec2string(dw + startX - endX, startY - endY, "moveto")
+        runLengths = self._getRunLengths(dw, dh)
+        # numbered among the subroutines of the variants too
+        subrns = getSubroutineNumbers(runLengths + self.variants[1:])
+
+        subrs = []
+        for i, length in enumerate(runLengths):
+            if length <= _MAX_INLINE_RUN and \
+                    length * (len(dot) + len(step) + 2) <= _MAX_RUN_SUBR_LENGTH:
+                subrs.append(" ".join([dot, step] * (length - 1) + [dot]))
+            else:
+                half = "{} callsubr".format(subrns[i - 1])
+                subrs.append(" ".join([half, step, half]))
+        # then a dot of each variant
+        for variant in range(1, len(self.variants)):
+            subrs.append(self._getDotSubroutine(dw, dh, variant))
+        return subrs
+
+    def getKey(self):
+        return ("external", self.startX, self.startY, self.endX, self.endY,
+                self.charstring, self.sx, self.sy, tuple(self.bbx),
+                self.maxRun, self.merge, self.radiusX, self.radiusY,
+                tuple(self.variants), self.neighbors,
+                tuple(self._variantTable or []))
+
+    def getGlyphBBX(self, bitmap, dw=100.0, dh=100.0):
+        if self._variantTable is None:
+            return DotShape.getGlyphBBX(self, bitmap, dw, dh)
+        # the dots of each variant
+        dots = {}
+        for x, y, variant in self._getDotVariants(bitmap):
+            dots.setdefault(variant, []).append((x, y))
+        if not dots:
+            return DotShape.getGlyphBBX(self, bitmap, dw, dh)
+        bounds = []
+        for variant, points in dots.items():
+            dBBX = self.getDotBBX(dw, dh, variant)
+            bounds.append([min(x for x, y in points) * dw + dBBX[0],
+                           min(y for x, y in points) * dh + dBBX[1],
+                           max(x for x, y in points) * dw + dBBX[2],
+                           max(y for x, y in points) * dh + dBBX[3]])
+        return [min(b[0] for b in bounds), min(b[1] for b in bounds),
+                max(b[2] for b in bounds), max(b[3] for b in bounds)]
+
+    def getDotBBX(self, dw=100.0, dh=100.0, variant=0):
         sw = self.sx * dw
         sh = self.sy * dh
-        return [_evalxy(v, x=sw, y=sh) for v in self.bbx]
+        return [_evalxy(v, x=sw, y=sh) for v in self.variants[variant][5]]
+
+
+_pixelOutline = DotShapePixelOutline()
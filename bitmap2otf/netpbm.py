@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import mmap
+
+
+class NetpbmError(Exception):
+    pass
+
+
+_byte2bits = [[bool(b >> (7 - i) & 1) for i in range(8)] for b in range(256)]
+
+_WHITESPACE = b" \t\r\n"
+
+
+def isNetpbm(path):
+    """Returns whether the file is a raw PBM (P4) or PGM (P5) image."""
+    with open(path, "rb") as f:
+        return f.read(2) in (b"P4", b"P5")
+
+
+class NetpbmImage(object):
+    """Raw PBM/PGM image read through a memory-mapped file.
+
+    Only the bytes of the requested cells are touched, so a huge sheet is
+    never decoded as a whole.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.magic = self._map[0:2]
+        if self.magic not in (b"P4", b"P5"):
+            raise NetpbmError("'{}' is not a raw PBM or PGM file".format(path))
+        pos = 2
+        fields = []
+        numfields = 2 if self.magic == b"P4" else 3
+        while len(fields) < numfields:
+            pos, field = self._readField(pos)
+            fields.append(field)
+        # exactly one whitespace character follows the header
+        self._offset = pos + 1
+
+        if self.magic == b"P4":
+            self.width, self.height = fields
+            self.maxval = 1
+            self._rowsize = (self.width + 7) // 8
+        else:
+            self.width, self.height, self.maxval = fields
+            if not 0 < self.maxval < 65536:
+                raise NetpbmError("invalid maxval in '{}'".format(path))
+            self._bytesperpixel = 1 if self.maxval < 256 else 2
+            self._rowsize = self.width * self._bytesperpixel
+
+        if self._offset + self._rowsize * self.height > len(self._map):
+            raise NetpbmError("'{}' is truncated".format(path))
+
+    def _readField(self, pos):
+        m = self._map
+        while True:
+            c = m[pos:pos + 1]
+            if not c:
+                raise NetpbmError("unexpected end of header")
+            if c == b"#":
+                while m[pos:pos + 1] not in (b"\n", b"\r", b""):
+                    pos += 1
+            elif c in _WHITESPACE:
+                pos += 1
+            else:
+                break
+        start = pos
+        while m[pos:pos + 1].isdigit():
+            pos += 1
+        if start == pos:
+            raise NetpbmError("invalid header")
+        return pos, int(m[start:pos])
+
+    def getBitmap(self, x, y, w, h):
+        """Returns the rows (top to bottom) of the cell whose top-left corner
+        is (x, y), with True for black pixels.
+
+        Like Image.crop, pixels outside the image are treated as black.
+        """
+        bitmap = []
+        for yy in range(y, y + h):
+            if not 0 <= yy < self.height:
+                bitmap.append([True] * w)
+                continue
+            x0 = max(x, 0)
+            x1 = min(x + w, self.width)
+            row = [True] * min(x0 - x, w)
+            if x0 < x1:
+                row.extend(self._getRow(yy, x0, x1))
+            row.extend([True] * (w - len(row)))
+            bitmap.append(row)
+        return bitmap
+
+    def _getRow(self, y, x0, x1):
+        rowoffset = self._offset + self._rowsize * y
+        if self.magic == b"P4":
+            # 1 is black in PBM
+            data = bytearray(self._map[rowoffset + x0 // 8:
+                                       rowoffset + (x1 + 7) // 8])
+            bits = []
+            for b in data:
+                bits.extend(_byte2bits[b])
+            start = x0 % 8
+            return bits[start:start + x1 - x0]
+
+        n = self._bytesperpixel
+        data = bytearray(self._map[rowoffset + x0 * n:rowoffset + x1 * n])
+        if n == 1:
+            return [v == 0 for v in data]
+        return [not (data[i] or data[i + 1]) for i in range(0, len(data), 2)]
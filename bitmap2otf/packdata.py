@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import json
+import os.path
+import sys
+
+from config import ConfigFileError
+from config import GlyphSourceBitmap
+from config import _getGlyphSlotInfos
+from config import data2hex
+from config import getItem
+from config import packBitmap
+
+
+def packconfig(config, binpath=None, basepath=""):
+    """Rewrites the 'data' glyph sources of a parsed config file in the
+    packed form.  If binpath is given, the glyphs are written to that file
+    and the sources refer to it relative to basepath, the directory of the
+    rewritten config file; otherwise they are converted to hex."""
+    glyphsrcs = getItem(config, "glyphs")
+    default_size = glyphsrcs.get("bitmapSize")
+    bindata = bytearray()
+    for glyphsrc in getItem(glyphsrcs, "sources", "glyphs object"):
+        data = glyphsrc.get("data")
+        if data is None or isinstance(data, dict):
+            continue
+        bitmapSize = glyphsrc.get("bitmapSize", default_size)
+        if bitmapSize is None:
+            raise ConfigFileError(
+                "property 'bitmapSize' not found in glyph source object")
+        if binpath is None:
+            glyphsrc["data"] = data2hex(data, bitmapSize)
+            continue
+        bitmapwidth, bitmapheight = bitmapSize
+        bitmap = GlyphSourceBitmap.data2bitmap(data, {"bitmapSize": bitmapSize})
+        bitmap += [[]] * (bitmapheight - len(bitmap))
+        glyphsrc["data"] = {
+            "file": os.path.relpath(binpath, basepath or os.curdir),
+            "offset": len(bindata),
+        }
+        # the file holds a glyph for each slot of the source
+        slots = _getGlyphSlotInfos(glyphsrc)
+        bindata += packBitmap(bitmap[:bitmapheight], bitmapwidth) * len(slots)
+    return bindata
+
+
+def main(configfilepath, outpath, binpath=None):
+    with io.open(configfilepath, "r", encoding="utf-8") as configfile:
+        config = json.load(configfile)
+
+    bindata = packconfig(
+        config, binpath, os.path.dirname(os.path.abspath(outpath)))
+    if binpath is not None:
+        with open(binpath, "wb") as binfile:
+            binfile.write(bindata)
+
+    with io.open(outpath, "w", encoding="utf-8") as outfile:
+        outfile.write(json.dumps(config, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if len(args) not in (2, 3):
+        print("""\
+usage: {} CONFIG-FILE.json OUTPUT-CONFIG-FILE.json [GLYPH-DATA.bin]
+
+Converts 'data' glyph sources into packed hex rows, or into a binary
+glyph data file that the output config file refers to.
+""".format(sys.argv[0]))
+        sys.exit(1)
+    main(*args)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+
+
+class BuildCancelled(Exception):
+    pass
+
+
+class BuildProgress(object):
+    """Reports the progress of a build, and lets it be cancelled.
+
+    callback(stage, done, total, elapsed) is called as the build goes:
+      "glyphs": glyphs made from the glyph sources
+      "effects": effects applied
+      "compile": glyphs compiled (for each variant)
+      "font": fonts built, and saved when the build saves them
+    done and total count the glyphs, effects or fonts of the stage, and
+    elapsed is the time in seconds since the progress was made.  Glyphs
+    are reported in chunks of chunkSize.
+
+    cancel (which may be called from another thread, or by the callback)
+    makes the build raise BuildCancelled at the end of the chunk, before
+    any more font is saved.
+    """
+
+    def __init__(self, callback=None, chunkSize=256):
+        self.callback = callback
+        self.chunkSize = chunkSize
+        self.start = time.time()
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def check(self):
+        """Raises BuildCancelled if the build was cancelled."""
+        if self.cancelled:
+            raise BuildCancelled("the build was cancelled")
+
+    def report(self, stage, done, total):
+        if self.callback is not None:
+            self.callback(stage, done, total, time.time() - self.start)
+        self.check()
+
+    def iterate(self, stage, items):
+        """Yields the items, reporting them in chunks as done in stage."""
+        total = len(items)
+        for i, item in enumerate(items, 1):
+            yield item
+            if i % self.chunkSize == 0 or i == total:
+                self.report(stage, i, total)
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+
+# Factors out operator sequences shared by charstrings into global
+# subroutines.
+#
+# Charstrings are split into contours at each moveto.  A candidate for a
+# subroutine is the part of a contour after its moveto, optionally followed
+# by the next few contours (with their movetos, which are relative and so
+# are the same wherever the contours appear).  The candidates are counted
+# with a hash table, which takes time linear in the size of the
+# charstrings, and each charstring is then covered with the subroutines by
+# dynamic programming.
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import re
+
+from dotshape import _numberSize
+from dotshape import getSubroutineNumbers
+
+# the longest candidate spans this many contours
+MAX_CONTOURS = 4
+
+# the most subroutines a CFF INDEX holds
+MAX_SUBRS = 65535
+
+# bytes of the shortest "N callgsubr" and of the subroutine's "return" and
+# INDEX offset
+_CALL_SIZE = 2
+_SUBR_OVERHEAD = 4
+
+
+def _callSizes(count):
+    """Returns the sizes in bytes of "N callgsubr" for count subroutines, in
+    the order of their numbers."""
+    return [_numberSize(n) + 1 for n in getSubroutineNumbers(range(count))]
+
+
+def _byUses(uses):
+    """Returns the subroutines, the most used first."""
+    return sorted(range(len(uses)), key=lambda subr: (-uses[subr], subr))
+
+
+# whitespace after an operator
+_OPERATION_END_RE = re.compile(r"(?<=[A-Za-z])\s+")
+
+
+def _tokenSize(token):
+    if token[0].isalpha():
+        # operator (escaped operators are rare here)
+        return 1
+    return _numberSize(float(token))
+
+
+class _Operations(object):
+    """Operations (the operands and the operator) as integer ids."""
+
+    def __init__(self):
+        self.ids = {}
+        self.texts = []
+        self.sizes = []
+        self.movetos = []
+
+    def split(self, charstring):
+        ids = self.ids
+        ops = []
+        for text in _OPERATION_END_RE.split(charstring.strip()):
+            i = ids.get(text)
+            if i is None:
+                i = ids[text] = len(self.texts)
+                self.texts.append(text)
+                self.sizes.append(sum(_tokenSize(t) for t in text.split()))
+                self.movetos.append(text.endswith("moveto"))
+            ops.append(i)
+        return ops
+
+
+class _Glyph(object):
+    """Charstring split into contours, with the ids of the candidates that
+    start at each contour."""
+
+    def __init__(self, ops, sizes, movetos, candidates):
+        self.ops = ops
+        self.starts = starts = [
+            i + 1 for i, op in enumerate(ops) if movetos[op]]
+        n = len(starts)
+        # the body of contour k is ops[starts[k]:ends[k]], followed by the
+        # moveto of the next contour
+        self.ends = ends = [start - 1 for start in starts[1:]] + [len(ops)]
+        self.moveSizes = [sizes[ops[ends[k]]] if k + 1 < n else 0
+                          for k in range(n)]
+        self.bodySizes = [sum(sizes[op] for op in ops[starts[k]:ends[k]])
+                          for k in range(n)]
+        # candidates[k][s - 1]: id of the contours k to k + s - 1, or -1
+        self.candidates = [
+            [candidates.add(ops[starts[k]:ends[j]])
+             for j in range(k, min(k + MAX_CONTOURS, n))]
+            for k in range(n)]
+
+    def cover(self, subrOf, callSizes):
+        """Returns the choice for each contour: (subroutine index or -1,
+        number of contours), covering the charstring with the fewest
+        bytes.  subrOf maps candidate ids to subroutine indices or -1, and
+        callSizes gives the size of the call of each subroutine."""
+        n = len(self.starts)
+        moveSizes = self.moveSizes
+        cost = [0] * (n + 1)
+        choices = [None] * n
+        for k in range(n - 1, -1, -1):
+            best = self.bodySizes[k] + moveSizes[k] + cost[k + 1]
+            choice = (-1, 1)
+            for s, cid in enumerate(self.candidates[k], 1):
+                if cid >= 0 and subrOf[cid] >= 0:
+                    c = callSizes[subrOf[cid]] + moveSizes[k + s - 1] + cost[k + s]
+                    if c < best:
+                        best = c
+                        choice = (subrOf[cid], s)
+            cost[k] = best
+            choices[k] = choice
+        return choices
+
+    def getUses(self, choices):
+        k = 0
+        while k < len(choices):
+            subr, s = choices[k]
+            if subr >= 0:
+                yield subr
+            k += s
+
+    def toText(self, choices, texts, numbers):
+        ops = self.ops
+        buf = [texts[op] for op in ops[:self.starts[0]]] if self.starts else \
+            [texts[op] for op in ops]
+        n = len(self.starts)
+        k = 0
+        while k < n:
+            subr, s = choices[k]
+            if subr < 0:
+                buf.extend(texts[op] for op in ops[self.starts[k]:self.ends[k]])
+            else:
+                buf.append("{} callgsubr".format(numbers[subr]))
+            k += s
+            if k < n:
+                buf.append(texts[ops[self.ends[k - 1]]])
+        return " ".join(buf)
+
+
+class _Candidates(object):
+    def __init__(self):
+        self.ids = {}
+        self.seqs = []
+        self.counts = []
+
+    def add(self, ops):
+        if not ops:
+            return -1
+        seq = tuple(ops)
+        i = self.ids.get(seq)
+        if i is None:
+            i = self.ids[seq] = len(self.seqs)
+            self.seqs.append(seq)
+            self.counts.append(0)
+        self.counts[i] += 1
+        return i
+
+
+def subroutinize(charstrings, minSaving=1, maxPasses=3):
+    """Returns (charstrings, subrs): the charstrings calling the global
+    subroutines subrs (without return) for their shared parts."""
+    table = _Operations()
+    sizes = table.sizes
+    candidates = _Candidates()
+    glyphs = [_Glyph(table.split(cs), sizes, table.movetos, candidates)
+              for cs in charstrings]
+
+    def saving(cid, count, callSize=_CALL_SIZE):
+        size = sum(sizes[op] for op in candidates.seqs[cid])
+        return count * (size - callSize) - size - _SUBR_OVERHEAD
+
+    counts = candidates.counts
+    subrs = [cid for cid, count in enumerate(counts)
+             if count > 1 and saving(cid, count) >= minSaving]
+    if len(subrs) > MAX_SUBRS:
+        best = sorted(subrs, key=lambda cid: -saving(cid, counts[cid]))
+        subrs = sorted(best[:MAX_SUBRS])
+    uses = [counts[cid] for cid in subrs]
+
+    # Cover the charstrings and drop the subroutines that turned out to be
+    # used too few times, until all are worth it.
+    for i in range(maxPasses):
+        subrOf = [-1] * len(candidates.seqs)
+        for subr, cid in enumerate(subrs):
+            subrOf[cid] = subr
+        # calls take more bytes as the numbers grow, and the most used
+        # ones get the shortest numbers
+        callSizes = [None] * len(subrs)
+        for size, subr in zip(_callSizes(len(subrs)), _byUses(uses)):
+            callSizes[subr] = size
+        covers = [g.cover(subrOf, callSizes) for g in glyphs]
+        uses = [0] * len(subrs)
+        for g, choices in zip(glyphs, covers):
+            for subr in g.getUses(choices):
+                uses[subr] += 1
+        kept = [subr for subr, cid in enumerate(subrs)
+                if uses[subr] > 1 and
+                saving(cid, uses[subr], callSizes[subr]) >= minSaving]
+        if len(kept) == len(subrs):
+            break
+        if i == maxPasses - 1:
+            # dropping the unused ones does not change the covers
+            kept = [subr for subr in range(len(subrs)) if uses[subr]]
+            # (the choices inside a span are not followed)
+            newIndex = dict((subr, j) for j, subr in enumerate(kept))
+            covers = [[(newIndex.get(subr, -1), s) for subr, s in choices]
+                      for choices in covers]
+        subrs = [subrs[subr] for subr in kept]
+        uses = [uses[subr] for subr in kept]
+
+    order = _byUses(uses)
+    subrns = getSubroutineNumbers(subrs)
+    numbers = [None] * len(subrs)
+    for n, subr in enumerate(order):
+        numbers[subr] = subrns[n]
+
+    texts = table.texts
+    res = [g.toText(choices, texts, numbers)
+           for g, choices in zip(glyphs, covers)]
+    return res, [" ".join(texts[op] for op in candidates.seqs[subrs[subr]])
+                 for subr in order]